@@ -3,17 +3,23 @@ Manual minimal agent loop for MLX + LLaMA-3.2 (ChatMLX)
 - Parses tool calls produced by the model and executes them directly.
 - Stops when the model emits "Final Answer: <...>"
 """
+import ast
 import asyncio
 import re
 import json
 import sys
+import time
 
 from datetime import datetime
-from typing import Callable, Dict, Any, Tuple, Optional
-from langchain_community.llms.mlx_pipeline import MLXPipeline
-from langchain_community.chat_models.mlx import ChatMLX
+from typing import Callable, Dict, Any, Iterable, Iterator, Tuple, Optional
 from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage, BaseMessage, AIMessage
 
+from chat.context_budget import ContextBudgeter, TokenCounter
+from chat.tool_grammar import ToolCallConstraint
+from chat.tool_executor import ToolExecutor, tool_options
+from chat.response_cache import ResponseCache
+from chat.tool_stream import ToolCallStream
+
 
 
 # ---- Replace these imports with your actual MLX + ChatMLX classes ----
@@ -45,30 +51,65 @@ def tool_search(query: str) -> str:
     # placeholder - replace with real web/search function
     return f"[search results for '{query}' (simulated)]"
 
-# map tool names to functions and a small schema for parsing arguments
-TOOLS: Dict[str, Tuple[Callable[..., str], Dict[str, type]]] = {
+# map tool names to functions and a small schema for parsing arguments,
+# optionally followed by execution options: timeout (s) and ttl (s) of cached results, see tool_executor.py,
+# and cache: False for tools whose result changes (replies after them are never taken from the response cache)
+TOOLS: Dict[str, tuple] = {
     "echo": (tool_echo, {"text": str}),
-    "add": (tool_add, {"a": float, "b": float}),
-    "search": (tool_search, {"query": str}),
-    "get_current_time": (get_current_time, {}),
+    "add": (tool_add, {"a": float, "b": float}, {"timeout": 1.0, "ttl": 3600}),
+    "search": (tool_search, {"query": str}, {"timeout": 5.0, "ttl": 300}),
+    "get_current_time": (get_current_time, {}, {"timeout": 1.0, "cache": False}),
 }
 
 def try_parse_json_block(text: str) -> Optional[list[Dict[str, Any]]]:
-    """Look for a ```json {...}``` block and parse it into dict."""
+    """Parse the model's tool call list: JSON, or a Python literal for the single-quoted form the prompt shows."""
     try:
-        return json.loads(text.replace("'","\""))
+        return json.loads(text)
     except json.JSONDecodeError as e:
-        eprint("Invalid JSON syntax:", e)
+        error = e
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        eprint("Invalid JSON syntax:", error)
         return None
 
+def tools_prompt(tools: Dict[str, Tuple[Callable[..., str], Dict[str, type]]]) -> str:
+    """Tool instructions for single-pass mode, generated from the TOOLS schemas."""
+    lines = []
+    for name, (func, schema, *_) in tools.items():
+        params = ", ".join(f'"{k}": <{t.__name__}>' for k, t in schema.items())
+        doc = (func.__doc__ or "").strip()
+        lines.append(f'             - {name}{": " + doc if doc else ""} [{{"name": "{name}", "params": {{{params}}}}}]')
+    return ("""
+            You can call these tools when the answer needs data you don't have:
+""" + "\n".join(lines) + """
+            To call tools, reply with ONLY a JSON list of calls in the format shown, e.g. [{"name": ..., "params": {...}}].
+            Otherwise answer the caller directly, without any JSON.
+        """)
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
 # ---------------- The manual agent loop ----------------
 class ManualAgent:
-    def __init__(self, chat_model):
+    def __init__(self, chat_model, context_budget: Optional[int] = None, single_pass: bool = False,
+                 history=None, executor: Optional[ToolExecutor] = None, response_cache: Optional[ResponseCache] = None):
         """
         chat_model: an object with a .generate or .call method that accepts messages.
                     Expected to accept a "messages" style list of dicts:
                     [{"role":"system","content":...},{"role":"user","content":...}, ...]
                     Adjust send_prompt() to match your model wrapper.
+        context_budget: optional token limit for the conversation memory, the oldest turns
+                    are dropped once it's exceeded (the system prompt is kept)
+        single_pass: one LLM call per turn, the model answers directly or emits a tool call
+                    that is kept on the TOOLS schema by constrained decoding
+        history:    optional conversation memory to use instead of a new list, e.g. a Session
+                    from chat/sessions.py; it must already start with the system prompt, and
+                    with single_pass it must hold message objects (SessionManager(render=as_message))
+        executor:   optional ToolExecutor shared between agents, one is created otherwise
+        response_cache: optional ResponseCache shared between agents, replies to a conversation
+                    state seen before (e.g. the call opening) are reused instead of generated
         """
         self.chat = chat_model
         self.system_prompt = """
@@ -83,17 +124,30 @@ class ManualAgent:
              - If you need to sum two numbers a and b then use '[{'name':'add','params':{'a':number,'b':number}}]'
             In the response, print only a valid JSON with the list of tools in the format above: '[{...},{...}]'. You SHOULD NOT use any other text in the response except of JSON. If you don't need any tool data, just print 'NO'.
         """
+        self.single_pass = single_pass
+        self.executor = executor or ToolExecutor(TOOLS, self.run_tool)  # tool calls of one reply run concurrently
+        self.calls = 0  # LLM calls, for the per-turn stats
+        self.response_cache = response_cache
+        self.volatile = False  # this turn called a tool with cache: False
+        self.turns: list[Tuple[str, int, float]] = []  # (mode, LLM calls, seconds) per turn
         # conversation memory
         self.messages = [
             SystemMessage(self.system_prompt),
         ]
+        if context_budget:
+            self.messages = ContextBudgeter(TokenCounter(self.chat.tokenizer.encode), context_budget)
+            self.messages.append(SystemMessage(self.system_prompt))
+        if history is not None:
+            if single_pass and isinstance(next(iter(history), None), dict):
+                raise ValueError("single-pass mode reads message objects, render the history with sessions.as_message")
+            self.messages = history
 
     def run_tool(self, tool_name: str, args: dict)->str:
         eprint(f"[Agent] Parsed action: {tool_name} with args: {args!r}")
         if tool_name not in TOOLS:
             return f"Error: unknown tool '{tool_name}'"
         else:
-            func, schema = TOOLS[tool_name]
+            func, schema = TOOLS[tool_name][:2]
             # Normalize args:
             args_dict = args
 
@@ -107,13 +161,66 @@ class ManualAgent:
                         # fallback: pass original
                         casted[k] = args_dict[k]
             try:
-                return func(**casted)
+                return func(**casted)  # an async tool's coroutine, awaited by the ToolExecutor
             except TypeError as e:
-                return f"Failed to call tool {tool_name}: " + e
+                return f"Failed to call tool {tool_name}: {e}"
 
     def send_prompt(self, messages) -> BaseMessage:
+        return AIMessage("".join(self._cached(messages, lambda: [self._invoke(messages).text])))
+
+    def _invoke(self, messages) -> BaseMessage:
+        self.calls += 1
         return self.chat.invoke(messages)
 
+    def stream_prompt(self, messages) -> Iterator[str]:
+        """Like send_prompt(), yielding the reply as it is generated."""
+        return self._cached(messages, lambda: self._stream(messages))
+
+    def _stream(self, messages) -> Iterator[str]:
+        self.calls += 1
+        for chunk in self.chat.stream(messages):
+            yield chunk.content
+
+    def _cached(self, messages, generate: Callable[[], Iterable[str]], **params) -> Iterator[str]:
+        """The reply from the response cache in one piece, or generate()'s pieces, remembered once complete"""
+        cache = self.response_cache
+        if cache is not None and self.volatile:
+            cache.bypass()  # the reply depends on a tool result that changes
+            cache = None
+        if cache is None:
+            yield from generate()
+            return
+        model, options = chat_identity(self.chat)
+        key = ResponseCache.key(messages, model, {**options, **params})
+        if (text := cache.get(key)) is not None:
+            yield text
+            return
+        start, pieces = time.perf_counter(), []
+        for piece in generate():
+            pieces.append(piece)
+            yield piece
+        cache.put(key, "".join(pieces), time.perf_counter() - start)
+
+    def send_constrained(self, messages, max_tokens: int = 128) -> BaseMessage:
+        """Like send_prompt(), but any tool call the model starts must follow the TOOLS schemas."""
+        return AIMessage("".join(self.stream_constrained(messages, max_tokens)).strip())
+
+    def stream_constrained(self, messages, max_tokens: int = 128) -> Iterator[str]:
+        """send_constrained(), yielding the reply as it is generated."""
+        return self._cached(messages, lambda: self._stream_constrained(messages, max_tokens), constrained=max_tokens)
+
+    def _stream_constrained(self, messages, max_tokens: int) -> Iterator[str]:
+        from mlx_lm import stream_generate
+        llm = self.chat.llm  # ChatMLX -> MLXPipeline, which holds the loaded model and tokenizer
+        roles = {"system": "system", "human": "user", "ai": "assistant", "tool": "tool"}
+        prompt = llm.tokenizer.apply_chat_template(
+            [{"role": "system", "content": m} if isinstance(m, str) else {"role": roles.get(m.type, "user"), "content": m.text}
+             for m in messages], tokenize=False, add_generation_prompt=True)
+        self.calls += 1
+        for chunk in stream_generate(llm.model, llm.tokenizer, prompt, max_tokens=max_tokens,
+                                     logits_processors=[ToolCallConstraint(llm.tokenizer, TOOLS)]):
+            yield chunk.text
+
     def _parse_model_output(self, message: BaseMessage) -> BaseMessage:
         # Check final answer first (so if model finishes, we stop)
         text = message.text
@@ -126,15 +233,86 @@ class ManualAgent:
         if parsed_json:
             if not isinstance(parsed_json, list):
                 parsed_json=[parsed_json]
-            for item in parsed_json:
-                # expected shape: {"name":"tool_name","params":{...}}
-                tool_name = item["name"]
-                args = item["params"]
-                message += f"Tool {tool_name}, response: {self.run_tool(tool_name, args)}"
+            # expected shape: {"name":"tool_name","params":{...}}
+            calls = [(item["name"], item["params"]) for item in parsed_json]
+            self.volatile |= any(self._volatile(name) for name, _ in calls)
+            for (tool_name, args), response in zip(calls, self.executor.run_all(calls)):
+                message += f"Tool {tool_name}, response: {response}"
 
         return SystemMessage(content=message)
 
-    def run(self, user_query: str, max_steps: int = 3)->BaseMessage:
+    @staticmethod
+    def _volatile(tool_name: str) -> bool:
+        return tool_options(TOOLS.get(tool_name, ())).get("cache", True) is False
+
+    def run(self, user_query: str, max_steps: int = 3, on_text: Optional[Callable[[str], None]] = None)->BaseMessage:
+        """on_text: single-pass mode only, receives the answer piece by piece while it's generated (e.g. for TTS)"""
+        start, calls = time.perf_counter(), self.calls
+        self.volatile = False
+        if self.single_pass and on_text:
+            mode, reply = "single-stream", self.run_streaming(user_query, on_text)
+        elif self.single_pass:
+            mode, reply = "single", self.run_single_pass(user_query)
+        else:
+            mode, reply = "two-pass", self.run_two_pass(user_query)
+        self.turns.append((mode, self.calls - calls, time.perf_counter() - start))
+        return reply
+
+    def run_streaming(self, user_query: str, on_text: Callable[[str], None]) -> BaseMessage:
+        """Single pass on the token stream: prose goes straight to on_text, each tool starts as soon as its call is complete."""
+        eprint(f"[USER:] - {user_query}")
+        self.messages.append(HumanMessage(user_query))
+        started = []  # (tool name, future), in call order
+
+        def start_tool(name: str, params: dict):
+            self.volatile |= self._volatile(name)
+            started.append((name, asyncio.run_coroutine_threadsafe(self.executor.call(name, params), self.executor.loop)))
+
+        detector = ToolCallStream(start_tool, try_parse_json_block)
+        text = ""
+        for piece in self.stream_constrained([SystemMessage(self.system_prompt + tools_prompt(TOOLS))] + list(self.messages)[1:]):
+            text += piece
+            if prose := detector.feed(piece):
+                on_text(prose)
+        eprint(f"[Model reply]:{text}")
+        if not detector.finish():
+            return AIMessage(text.strip())  # answered directly, already streamed
+        for error in detector.errors:
+            eprint("Invalid tool call:", error)
+        message = "Use the results of this tools to answer the following user message:"
+        for tool_name, future in started:
+            message += f"Tool {tool_name}, response: {future.result()}"
+        eprint(f"[AI] - {message}")
+        self.messages.append(SystemMessage(content=message))
+        answer = ""
+        for piece in self.stream_prompt(list(self.messages)):
+            answer += piece
+            on_text(piece)
+        return AIMessage(answer)
+
+    def run_single_pass(self, user_query: str) -> BaseMessage:
+        eprint(f"[USER:] - {user_query}")
+        self.messages.append(HumanMessage(user_query))
+        reply = self.send_constrained([SystemMessage(self.system_prompt + tools_prompt(TOOLS))] + list(self.messages)[1:])
+        eprint(f"[Model reply]:{reply.text}")
+        parsed = self._parse_model_output(reply)
+        if not isinstance(parsed, SystemMessage):
+            return reply  # answered directly, one call
+        eprint(f"[AI] - {parsed.text}")
+        self.messages.append(parsed)
+        return self.send_prompt(list(self.messages))
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """LLM calls per turn and turn latency, per mode"""
+        stats = {}
+        for mode in sorted({t[0] for t in self.turns}):
+            turns = [t for t in self.turns if t[0] == mode]
+            seconds = [t[2] for t in turns]
+            stats[mode] = {"turns": len(turns), "llm_calls_per_turn": sum(t[1] for t in turns) / len(turns),
+                           "p50_s": percentile(seconds, 0.5), "p95_s": percentile(seconds, 0.95)}
+        return stats
+
+    def run_two_pass(self, user_query: str) -> BaseMessage:
         func_asked = HumanMessage(user_query + "\n\n" + self.function_question_prompt)
         eprint(f"[FUNC] - {func_asked}")
         func_chat = [self.system_prompt, func_asked]
@@ -152,7 +330,7 @@ class ManualAgent:
         # strategy: ask the model to reformat (simple fix)
         eprint(f"[USER:] - {user_query}")
         self.messages.append(HumanMessage(user_query))
-        return self.send_prompt(self.messages)
+        return self.send_prompt(list(self.messages))
 
 
 
@@ -161,29 +339,78 @@ class ManualAgent:
 # --- 1. Initialize the MLX model / pipeline ---
 # Use the model ID you have (for example, a quantized llama3 model in MLX)
 # e.g. "your-llama3-quantized-model" or a HuggingFace / MLX community ID
-llm = MLXPipeline.from_model_id(
-    "mlx-community/Llama-3.2-3B-Instruct-4bit",
-    pipeline_kwargs={"max_tokens": 128, "temperature": 0.3,
-                     "stop": ["\nFinal Answer:", "\nObservation:"]},
-)
+MODEL = "mlx-community/Llama-3.2-3B-Instruct-4bit"
+
+
+def chat_identity(chat) -> tuple[str, dict]:
+    """The model id and generation params a chat model's replies depend on, ChatMLX or DaemonChat"""
+    if (llm := getattr(chat, "llm", None)) is not None:
+        return getattr(llm, "model_id", ""), dict(getattr(llm, "pipeline_kwargs", None) or {})
+    return getattr(chat, "model", ""), dict(getattr(chat, "options", None) or {})
 
-# Wrap it to a chat model interface
-chat = ChatMLX(llm=llm)
-# adapt to your chat model wrapper; we implement send_prompt by delegation
-agent = ManualAgent(chat_model=chat)
+
+def load_chat(local: bool = False):
+    """The chat model, loaded on first use so importing this module (e.g. for TOOLS) stays fast.
+    Attaches to a running chat/daemon.py instead of loading, unless `local`."""
+    from chat.daemon import DaemonChat, ModelClient
+    if not local and ModelClient.running():
+        eprint("[Agent] using the model daemon")
+        return DaemonChat(ModelClient(), MODEL, max_tokens=128, temperature=0.3,
+                          stop=["\nFinal Answer:", "\nObservation:"])
+    from langchain_community.llms.mlx_pipeline import MLXPipeline
+    from langchain_community.chat_models.mlx import ChatMLX
+    llm = MLXPipeline.from_model_id(
+        MODEL,
+        pipeline_kwargs={"max_tokens": 128, "temperature": 0.3,
+                         "stop": ["\nFinal Answer:", "\nObservation:"]},
+    )
+    # Wrap it to a chat model interface
+    return ChatMLX(llm=llm)
+
+
+def show(piece: str):
+    print(piece, end="", flush=True)
 
 
 # define your function normally, using `async def` instead of `def`
-async def chat34():
-    message = agent.run("Hello?")
+async def chat34(agent: ManualAgent, stream: bool = False):
+    """stream: print the answer as it's generated (single-pass mode only, two-pass replies come whole)"""
+    on_text = show if stream else None
+    if stream:
+        print("AI:", end=" ", flush=True)
+    message = agent.run("Hello?", on_text=on_text)
     while True:
         text = message.text
-        print("AI:", text)
+        if stream:
+            print()
+        else:
+            print("AI:", text)
         user_message = input("USER: ")
         if user_message == "bye":
+            eprint(f"[Stats] {agent.stats()}")
+            eprint(f"[Tools] {agent.executor.stats()}")
+            eprint(f"[Response cache] {agent.response_cache.stats()}")
             return
         # now, you can use `await` to call kani's async methods
-        message = agent.run(user_message)
+        if stream:
+            print("AI:", end=" ", flush=True)
+        message = agent.run(user_message, on_text=on_text)
+
+
+def main():
+    single_pass = "--single-pass" in sys.argv
+    # adapt to your chat model wrapper; we implement send_prompt by delegation
+    # --single-pass: one LLM call per turn, with schema-constrained tool calls (needs the model in this process)
+    # --local: load the model here even when the model daemon runs
+    chat = load_chat(local=single_pass or "--local" in sys.argv)
+    # every call opens the same way, the replies to repeated conversation states are reused for an hour
+    agent = ManualAgent(chat_model=chat, single_pass=single_pass, response_cache=ResponseCache())
+    # --stream (with --single-pass): print the answer as it's generated, start tools as soon as each call is complete
+    stream = "--stream" in sys.argv
+    if stream and not single_pass:
+        eprint("--stream needs --single-pass, replies are printed whole")
+    asyncio.run(chat34(agent, stream=stream and single_pass))
+
 
 if __name__ == "__main__":
-    asyncio.run(chat34())
+    main()
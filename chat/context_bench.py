@@ -0,0 +1,87 @@
+"""
+Per-turn context bookkeeping cost on long synthetic calls.
+
+Simulates what happens before every model call: the history is measured and trimmed to the
+context window. 'naive' re-tokenizes every message on every turn, the way kani calls
+MlxEngine.message_len; 'memoized' uses TokenCounter; 'budgeter' keeps a running total with
+ContextBudgeter. The model itself is not run, only the bookkeeping is timed.
+
+    python -m chat.context_bench --turns 200 --tokenizer gpt2
+"""
+import argparse
+import random
+import re
+import time
+
+from chat.context_budget import ContextBudgeter, TokenCounter
+
+WORDS = ("appointment clinic doctor tomorrow morning afternoon insurance card number prescription "
+         "schedule available Monday Tuesday please thank you could would like check results").split()
+
+
+def synthetic_call(turns: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    messages = [{"role": "system", "content": "You are a call center assistant. " * 20}]
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 60)))})
+    return messages
+
+
+def naive_fit(history: list[dict], encode, budget: int) -> list[dict]:
+    """kani-style: walk back from the newest message, tokenizing each one, until the budget is full"""
+    total, keep = len(encode(history[0]["content"])), []
+    for message in reversed(history[1:]):
+        total += len(encode(message["content"]))
+        if total > budget:
+            break
+        keep.append(message)
+    return history[:1] + keep[::-1]
+
+
+def run(mode: str, call: list[dict], encode, budget: int) -> list[float]:
+    """Seconds of bookkeeping per turn"""
+    times = []
+    if mode == "budgeter":
+        history = ContextBudgeter(TokenCounter(encode), budget)
+        for message in call:
+            start = time.perf_counter()
+            history.append(message)
+            list(history)
+            times.append(time.perf_counter() - start)
+        return times
+    counter = TokenCounter(encode)
+    measure = encode if mode == "naive" else lambda text: [None] * counter({"content": text})
+    history = []
+    for message in call:
+        start = time.perf_counter()
+        history.append(message)
+        naive_fit(history, measure, budget)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-turn context bookkeeping cost on long synthetic calls")
+    parser.add_argument("--turns", type=int, default=200, help="Turns per call (default: 200)")
+    parser.add_argument("--budget", type=int, default=2048, help="Context budget in tokens (default: 2048)")
+    parser.add_argument("--tokenizer", help="Hugging Face tokenizer to count with (default: a regex word splitter)")
+    args = parser.parse_args()
+
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        encode = AutoTokenizer.from_pretrained(args.tokenizer).encode
+    else:
+        encode = re.compile(r"\w+|[^\w\s]").findall
+
+    call = synthetic_call(args.turns)
+    quarter = max(1, len(call) // 4)
+    print(f"{'mode':<10} {'first 1/4 ms':>13} {'last 1/4 ms':>12} {'total ms':>9}")
+    for mode in ("naive", "memoized", "budgeter"):
+        times = run(mode, call, encode, args.budget)
+        first, last = (1000 * sum(t) / len(t) for t in (times[:quarter], times[-quarter:]))
+        print(f"{mode:<10} {first:13.3f} {last:12.3f} {1000 * sum(times):9.1f}")
+
+
+if __name__ == "__main__":
+    main()
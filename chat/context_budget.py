@@ -0,0 +1,109 @@
+"""
+Token counting and context budgeting that stay cheap on long calls.
+
+kani asks the engine for every message's length each time it fits the history into the context
+window, so a plain `len(tokenizer.encode(text))` re-tokenizes the whole call on every turn.
+TokenCounter remembers the count per (role, text); a message is tokenized once, when it is new.
+ContextBudgeter keeps a running token total for a history. When the total goes over the budget,
+it drops the oldest unpinned turns (or folds them into a summary) until it is back under a low
+water mark, so trimming happens every few turns instead of on every turn.
+"""
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+def _key(message: Any) -> tuple:
+    if isinstance(message, str):
+        return ("", message)
+    if isinstance(message, dict):
+        return (message.get("role", ""), message.get("content") or "")
+    role = getattr(message, "role", None) or getattr(message, "type", "")
+    text = getattr(message, "text", None)
+    if text is None:
+        text = getattr(message, "content", "")
+    return (getattr(role, "name", role), str(text or ""))
+
+
+class TokenCounter:
+    def __init__(self, encode: Callable[[str], list], maxsize: int = 100_000):
+        """
+        encode: the tokenizer's text -> token ids function
+        maxsize: counts remembered, least recently used ones are forgotten beyond this
+        """
+        self.encode = encode
+        self.maxsize = maxsize
+        self.counts: OrderedDict[tuple, int] = OrderedDict()
+        self.hits = self.misses = 0
+
+    def __call__(self, message: Any) -> int:
+        """Token count of a message (kani ChatMessage, langchain message, role/content dict or str)."""
+        key = _key(message)
+        if (count := self.counts.get(key)) is not None:
+            self.hits += 1
+            self.counts.move_to_end(key)
+            return count
+        self.misses += 1
+        self.counts[key] = count = len(self.encode(key[1]))
+        if len(self.counts) > self.maxsize:
+            self.counts.popitem(last=False)
+        return count
+
+    def stats(self) -> dict:
+        return {"entries": len(self.counts), "hits": self.hits, "misses": self.misses}
+
+
+class ContextBudgeter:
+    def __init__(self, count: Callable[[Any], int], budget: int, pinned: int = 1, low_water: float = 0.75,
+                 summarize: Callable[[list], Any] | None = None):
+        """
+        count: message -> tokens, e.g. a TokenCounter
+        budget: most tokens the history may hold
+        pinned: leading messages that are never dropped (the system prompt)
+        low_water: when over budget, trim down to this fraction of it
+        summarize: optional, turns the dropped messages into one message kept in their place
+        """
+        self.count, self.budget, self.pinned = count, budget, pinned
+        self.low_water, self.summarize = low_water, summarize
+        self.messages: list = []
+        self.sizes: list[int] = []
+        self.total = 0
+        self.dropped = self.trims = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def append(self, message: Any):
+        self.messages.append(message)
+        self.sizes.append(size := self.count(message))
+        self.total += size
+        if self.total > self.budget:
+            self.trim()
+
+    def extend(self, messages: list):
+        for message in messages:
+            self.append(message)
+
+    def trim(self):
+        """Drops the oldest unpinned messages until the history is under the low water mark."""
+        target, end = self.budget * self.low_water, self.pinned
+        removed = 0
+        # the newest message always stays, whatever its size
+        while end < len(self.messages) - 1 and self.total - removed > target:
+            removed += self.sizes[end]
+            end += 1
+        if end == self.pinned:
+            return
+        old = self.messages[self.pinned:end]
+        replacement = [self.summarize(old)] if self.summarize else []
+        self.messages[self.pinned:end] = replacement
+        self.sizes[self.pinned:end] = [self.count(m) for m in replacement]
+        self.total = sum(self.sizes)  # O(history) once per trim, not per turn
+        self.dropped += len(old)
+        self.trims += 1
+
+    def stats(self) -> dict:
+        return {"messages": len(self.messages), "tokens": self.total, "budget": self.budget,
+                "dropped": self.dropped, "trims": self.trims}
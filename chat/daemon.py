@@ -0,0 +1,320 @@
+"""
+Long-lived local model daemon, so scripts don't pay the multi-GB model load on every start.
+
+    python -m chat.daemon --llm mlx-community/Llama-3.2-3B-Instruct-4bit --stt small   # load once, keep serving
+    python -m chat.load                                                                  # attaches while it runs
+
+The daemon holds loaded LLM (mlx_lm), STT (Whisper, through transcript/registry.py) and TTS
+(mlx_audio) models and serves them on a Unix socket. Models that weren't preloaded are loaded on
+their first request and kept. Connections are served concurrently, the models run one request
+at a time. This module only imports the standard library and numpy at the top, so clients
+attach in milliseconds; the model libraries are imported in the daemon, when a model is loaded.
+
+Protocol: one JSON line per request, answered by JSON lines, the last of which has "done": true.
+A line that carries audio says so with "bytes": n, and n bytes of float32 PCM follow it.
+    {"op": "generate", "model": id, "messages": [...], "max_tokens": n, "temperature": t, "stop": [...],
+     "tokenizer_config": {...}}
+        -> {"text": piece} ... {"done": true, "tokens": n, "seconds": s}
+    {"op": "transcribe", "model": size, "backend": "whisper" | "mlx", "language": l, "bytes": n} + 16 kHz audio
+        -> {"text": ..., "language": ..., "segments": [...], "done": true}
+    {"op": "speak", "model": repo, "text": ..., "voice": v, "lang_code": l}
+        -> {"sample_rate": sr, "bytes": n, "done": true} + audio
+    {"op": "load", "llm": [id or [id, tokenizer_config], ...], "stt": [...], "tts": [...]}, {"op": "stats"}
+Failures, malformed request lines included, are answered with {"error": message, "done": true}.
+An LLM is kept per (id, tokenizer config), e.g. {"eos_token": "eot_id"} for Llama 3 8B, whose
+tokenizer doesn't end turns on <|eot_id|> otherwise.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Iterator, Optional
+
+import numpy as np
+
+SOCKET = os.environ.get("CALL_CENTER_DAEMON") or os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), "call-center-models.sock")
+LLM = "mlx-community/Llama-3.2-3B-Instruct-4bit"
+STT = "small"
+TTS = "mlx-community/Spark-TTS-0.5B-fp16"
+TRANSCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "transcript")
+ROLES = {"system": "system", "human": "user", "ai": "assistant", "tool": "tool"}
+
+
+def _load_llm(model_id: str, tokenizer_config: Optional[dict] = None):
+    from mlx_lm import load
+    return load(model_id, tokenizer_config=tokenizer_config or {})
+
+
+def _held_back(text: str, stops: list[str]) -> int:
+    """Length of the tail of `text` that could be the start of a stop string"""
+    return max((n for stop in stops for n in range(1, len(stop)) if text.endswith(stop[:n])), default=0)
+
+
+def _load_stt(name: str):
+    """name: "backend:size", backend whisper or mlx"""
+    backend, size = name.split(":", 1)
+    if TRANSCRIPT not in sys.path:
+        sys.path.insert(0, TRANSCRIPT)  # the transcript scripts import each other as top-level modules
+    from registry import get_model
+    return backend, size, get_model(backend, size)
+
+
+def _load_tts(model_path: str):
+    from mlx_audio.tts.utils import load_model
+    return load_model(model_path)
+
+
+LOADERS = {"llm": _load_llm, "stt": _load_stt, "tts": _load_tts}
+
+
+def _label(key: tuple[str, str, str]) -> str:
+    kind, name, options = key
+    return f"{kind}/{name}" + ("" if options == "{}" else f" {options}")
+
+
+class ModelDaemon:
+    def __init__(self):
+        self.models: dict[tuple[str, str], Any] = {}
+        self.load_seconds: dict[str, float] = {}
+        self.lock = threading.RLock()  # one request at a time on the models
+        self.requests = defaultdict(int)
+        self.started = time.time()
+
+    def get(self, kind: str, name: str, options: Optional[dict] = None):
+        """A loaded model, loaded on first use. options: passed to the loader, e.g. an LLM's tokenizer_config"""
+        if kind == "stt" and ":" not in name:
+            name = "whisper:" + name
+        key = (kind, name, json.dumps(options or {}, sort_keys=True))
+        with self.lock:
+            if key not in self.models:
+                start = time.perf_counter()
+                self.models[key] = LOADERS[kind](name, **(options or {}))
+                self.load_seconds[_label(key)] = round(time.perf_counter() - start, 3)
+                print(f"Loaded {_label(key)} in {self.load_seconds[_label(key)]}s", file=sys.stderr)
+            return self.models[key]
+
+    def serve(self, path: str = SOCKET):
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        os.chmod(path, 0o600)  # the models are for this user only
+        server.listen()
+        print(f"Serving models on {path}", file=sys.stderr)
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        def send(header: dict, data: bytes = b""):
+            conn.sendall(json.dumps(header).encode() + b"\n" + data)
+
+        with conn, conn.makefile("rb") as f:
+            while line := f.readline():  # a client keeps its connection for many requests
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("a request is a JSON object")
+                except ValueError as e:
+                    try:
+                        send({"error": f"malformed request: {e}", "done": True})
+                    except OSError:
+                        return
+                    continue
+                payload = f.read(request["bytes"]) if request.get("bytes") else b""
+                op = request.get("op")
+                self.requests[op] += 1
+                try:
+                    if op == "stats":
+                        send({**self.stats(), "done": True})
+                        continue
+                    handler = getattr(self, f"_{op}", None) if op in ("generate", "transcribe", "speak", "load") else None
+                    if handler is None:
+                        raise ValueError(f"unknown op {op!r}")
+                    with self.lock:
+                        handler(request, payload, send)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                except Exception as e:
+                    send({"error": f"{type(e).__name__}: {e}", "done": True})
+
+    def _generate(self, request: dict, payload: bytes, send):
+        from mlx_lm import stream_generate
+        from mlx_lm.sample_utils import make_sampler
+        config = request.get("tokenizer_config")
+        model, tokenizer = self.get("llm", request.get("model") or LLM, {"tokenizer_config": config} if config else None)
+        prompt = tokenizer.apply_chat_template(request["messages"], add_generation_prompt=True)
+        stops = [stop for stop in request.get("stop") or () if stop]
+        start, tokens, pending = time.perf_counter(), 0, ""
+        for chunk in stream_generate(model, tokenizer, prompt, max_tokens=request.get("max_tokens", 512),
+                                     sampler=make_sampler(temp=request.get("temperature", 0.0))):
+            tokens += 1
+            pending += chunk.text
+            if found := [i for i in (pending.find(stop) for stop in stops) if i >= 0]:
+                pending = pending[:min(found)]  # the text is cut before the stop string, as MLXPipeline does
+                break
+            if n := len(pending) - _held_back(pending, stops):  # a possible stop string's start waits for the next piece
+                send({"text": pending[:n]})
+                pending = pending[n:]
+        if pending:
+            send({"text": pending})
+        send({"done": True, "tokens": tokens, "seconds": round(time.perf_counter() - start, 3)})
+
+    def _transcribe(self, request: dict, payload: bytes, send):
+        backend, size, model = self.get("stt", f"{request.get('backend') or 'whisper'}:{request.get('model') or STT}")
+        audio = np.frombuffer(payload, np.float32)
+        options = {"language": request["language"]} if request.get("language") else {}
+        if backend == "mlx":
+            import mlx_whisper
+            from mlx_whisper.transcribe import ModelHolder
+            ModelHolder.model, ModelHolder.model_path = model, size  # as transcribe_audio_mlx.py, never loaded twice
+            result = mlx_whisper.transcribe(audio, path_or_hf_repo=size, verbose=False, **options)
+        else:
+            result = model.transcribe(audio, **options)
+        send({"text": result["text"], "language": result.get("language"), "done": True,
+              "segments": [{k: s[k] for k in ("start", "end", "text")} for s in result.get("segments", [])]})
+
+    def _speak(self, request: dict, payload: bytes, send):
+        model = self.get("tts", request.get("model") or TTS)
+        options = {k: request[k] for k in ("voice", "lang_code", "speed") if k in request}
+        pieces = [np.asarray(result.audio, np.float32) for result in model.generate(text=request["text"], **options)]
+        audio = np.concatenate(pieces) if pieces else np.zeros(0, np.float32)
+        send({"sample_rate": model.sample_rate, "bytes": audio.nbytes, "done": True}, audio.tobytes())
+
+    def _load(self, request: dict, payload: bytes, send):
+        for kind in LOADERS:
+            for entry in request.get(kind, ()):
+                name, config = (entry, None) if isinstance(entry, str) else entry
+                self.get(kind, name, {"tokenizer_config": config} if config else None)
+        send({"loaded": [_label(key) for key in self.models], "done": True})
+
+    def stats(self) -> dict:
+        return {"loaded": [_label(key) for key in self.models], "load_seconds": self.load_seconds,
+                "requests": dict(self.requests), "uptime_s": round(time.time() - self.started, 1)}
+
+
+class DaemonError(RuntimeError):
+    pass
+
+
+class ModelClient:
+    """Thin client of a running daemon. A connection serves one request at a time, use one per thread."""
+
+    def __init__(self, path: str = SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)  # FileNotFoundError / ConnectionRefusedError when no daemon runs
+        self.file = self.sock.makefile("rb")
+
+    @staticmethod
+    def running(path: str = SOCKET) -> bool:
+        try:
+            ModelClient(path).close()
+            return True
+        except OSError:
+            return False
+
+    def _request(self, request: dict, payload: bytes = b"") -> Iterator[tuple[dict, bytes]]:
+        if payload:
+            request["bytes"] = len(payload)
+        self.sock.sendall(json.dumps(request).encode() + b"\n" + payload)
+        while True:
+            line = self.file.readline()
+            if not line:
+                raise DaemonError("daemon closed the connection")
+            reply = json.loads(line)
+            if "error" in reply:
+                raise DaemonError(reply["error"])
+            yield reply, self.file.read(reply["bytes"]) if reply.get("bytes") else b""
+            if reply.get("done"):
+                return
+
+    def generate(self, messages: list[dict], model: Optional[str] = None, **params) -> Iterator[str]:
+        """Yields the reply piece by piece. messages: role/content dicts"""
+        for reply, _ in self._request({"op": "generate", "model": model, "messages": messages, **params}):
+            if "text" in reply:
+                yield reply["text"]
+
+    def chat(self, messages: list[dict], model: Optional[str] = None, **params) -> str:
+        return "".join(self.generate(messages, model, **params))
+
+    def transcribe(self, audio: np.ndarray, model: Optional[str] = None, backend: str = "whisper",
+                   language: Optional[str] = None) -> dict:
+        """audio: mono 16 kHz samples"""
+        payload = np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+        request = {"op": "transcribe", "model": model, "backend": backend, "language": language}
+        return next(self._request(request, payload))[0]
+
+    def speak(self, text: str, model: Optional[str] = None, **options) -> tuple[np.ndarray, int]:
+        """Returns (audio, sample rate)"""
+        reply, data = next(self._request({"op": "speak", "model": model, "text": text, **options}))
+        return np.frombuffer(data, np.float32), reply["sample_rate"]
+
+    def load(self, llm: tuple = (), stt: tuple[str, ...] = (), tts: tuple[str, ...] = ()) -> list[str]:
+        """llm: model ids, or (id, tokenizer_config) pairs"""
+        return next(self._request({"op": "load", "llm": list(llm), "stt": list(stt), "tts": list(tts)}))[0]["loaded"]
+
+    def stats(self) -> dict:
+        return {k: v for k, v in next(self._request({"op": "stats"}))[0].items() if k != "done"}
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class DaemonChat:
+    """Drop-in for ChatMLX in ManualAgent that generates in the daemon (not for --single-pass, which needs the local model)."""
+
+    def __init__(self, client: ModelClient, model: str = LLM, max_tokens: int = 128, temperature: float = 0.3,
+                 stop: tuple[str, ...] = (), tokenizer_config: Optional[dict] = None):
+        self.client, self.model = client, model
+        self.options = {"max_tokens": max_tokens, "temperature": temperature, "stop": list(stop)}
+        if tokenizer_config:
+            self.options["tokenizer_config"] = tokenizer_config
+
+    @staticmethod
+    def _messages(messages: list) -> list[dict]:
+        # ManualAgent mixes plain strings (the system prompt) with message objects
+        return [{"role": "system", "content": m} if isinstance(m, str) else {"role": ROLES.get(m.type, "user"), "content": m.text}
+                for m in messages]
+
+    def invoke(self, messages: list, **options):
+        from langchain_core.messages import AIMessage
+        return AIMessage(self.client.chat(self._messages(messages), self.model, **(self.options | options)))
+
+    def stream(self, messages: list, **options):
+        from langchain_core.messages import AIMessageChunk
+        for piece in self.client.generate(self._messages(messages), self.model, **(self.options | options)):
+            yield AIMessageChunk(content=piece)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep LLM, STT and TTS models loaded and serve them on a Unix socket")
+    parser.add_argument("--socket", default=SOCKET, help=f"Socket path (default: {SOCKET}, or $CALL_CENTER_DAEMON)")
+    parser.add_argument("--llm", action="append", default=[], help="Preload this mlx_lm model (repeatable)")
+    parser.add_argument("--tokenizer-config", type=json.loads, help='Tokenizer config JSON for the --llm models, e.g. \'{"eos_token": "eot_id"}\'')
+    parser.add_argument("--stt", action="append", default=[], help="Preload this Whisper model, size or backend:size (repeatable)")
+    parser.add_argument("--tts", action="append", default=[], help="Preload this mlx_audio model (repeatable)")
+    args = parser.parse_args()
+
+    daemon = ModelDaemon()
+    for kind in LOADERS:
+        for name in getattr(args, kind):
+            daemon.get(kind, name, {"tokenizer_config": args.tokenizer_config} if kind == "llm" and args.tokenizer_config else None)
+    try:
+        daemon.serve(args.socket)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        print(json.dumps(daemon.stats(), indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,28 @@
 import asyncio
-import torch
 import os
 from datetime import datetime
 from kani import Kani, ai_function, chat_in_terminal
-from kani.engines.huggingface import HuggingEngine
 
-from chat.mlx_engine import MlxEngine
 
-engine = HuggingEngine(
-    model_id="meta-llama/Llama-3.1-8B-Instruct",
-    token=os.environ['HUGGINGFACE_AUTH_TOKEN'],
-    # suggested args from the Llama model card
-    model_load_kwargs={"device_map": "auto", "torch_dtype": torch.bfloat16},
-)
+def load_engine():
+    # torch and the model are only loaded when the chat starts, not on import
+    import torch
+    from kani.engines.huggingface import HuggingEngine
+    return HuggingEngine(
+        model_id="meta-llama/Llama-3.1-8B-Instruct",
+        token=os.environ['HUGGINGFACE_AUTH_TOKEN'],
+        # suggested args from the Llama model card
+        model_load_kwargs={"device_map": "auto", "torch_dtype": torch.bfloat16},
+    )
+
+
 # engine = LlamaCppEngine(
 #     repo_id="bartowski/Meta-Llama-3.1-8B-Instruct-GGUF",
 #     filename="Meta-Llama-3.1-8B-Instruct-Q6_K_L.gguf",
 #     prompt_pipeline=LLAMA2_PIPELINE
 # )
 
+# from chat.mlx_engine import MlxEngine
 # engine = MlxEngine("mlx-community/Meta-Llama-3-8B-Instruct-4bit")
 
 
@@ -28,9 +32,8 @@ engine = HuggingEngine(
 #         """Get the current date"""
 #         datetime.today().strftime('%Y-%m-%d')
 
-ai = Kani(engine,
-          system_prompt="You are a call center assistant Susan which helps patients of St Antonius medical clinic with scheduling appointments."
-                        "You ask questions one by one to not overload clients with many parallel questions.")
+SYSTEM_PROMPT = ("You are a call center assistant Susan which helps patients of St Antonius medical clinic with scheduling appointments."
+                 "You ask questions one by one to not overload clients with many parallel questions.")
 
 
 async def run_full_round_sync(bot: Kani, prompt: str) -> str:
@@ -38,6 +41,7 @@ async def run_full_round_sync(bot: Kani, prompt: str) -> str:
 
 # define your function normally, using `async def` instead of `def`
 async def chat_with_kani():
+    ai = Kani(load_engine(), system_prompt=SYSTEM_PROMPT)
     while True:
         user_message = input("USER: ")
         if user_message == "bye":
@@ -49,5 +53,6 @@ async def chat_with_kani():
         print("AI:", message)
 
 
-# use `asyncio.run` to call your async function to start the program
-asyncio.run(chat_with_kani())
+if __name__ == "__main__":
+    # use `asyncio.run` to call your async function to start the program
+    asyncio.run(chat_with_kani())
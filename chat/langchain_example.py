@@ -4,11 +4,8 @@ import logging
 
 from datetime import datetime
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_huggingface import ChatHuggingFace, HuggingFacePipeline
 from langchain_classic.agents import create_tool_calling_agent, initialize_agent, AgentType, Tool
 from langchain_core.tools import tool
-from langchain_community.llms.mlx_pipeline import MLXPipeline
-from langchain_community.chat_models.mlx import ChatMLX
 from langgraph.prebuilt import create_react_agent
 
 
@@ -23,6 +20,7 @@ echo_tool = Tool(
     description="Returns the current time in a string",
 )
 
+# from langchain_huggingface import HuggingFacePipeline
 # llm = HuggingFacePipeline.from_model_id(
 #     model_id="meta-llama/Llama-3.2-3B-Instruct",
 #     task="text-generation",
@@ -31,13 +29,19 @@ echo_tool = Tool(
 
 logging.basicConfig(level=logging.DEBUG)
 
-llm = MLXPipeline.from_model_id(
-    "mlx-community/Llama-3.2-3B-Instruct-4bit",
-    pipeline_kwargs={"max_tokens": 512, "temp": 0.1},
-)
 
-chat_model = ChatMLX(llm=llm)
-chat_model = chat_model.bind_tools([get_current_time])
+def load_chat_model():
+    # imported and loaded here, not at import time
+    from langchain_community.llms.mlx_pipeline import MLXPipeline
+    from langchain_community.chat_models.mlx import ChatMLX
+    llm = MLXPipeline.from_model_id(
+        "mlx-community/Llama-3.2-3B-Instruct-4bit",
+        pipeline_kwargs={"max_tokens": 512, "temp": 0.1},
+    )
+    chat_model = ChatMLX(llm=llm)
+    print(chat_model._to_chat_prompt(messages))
+    return chat_model.bind_tools([get_current_time])
+
 # agent = initialize_agent(llm=chat_model,
 #                          agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
 #                          tools=[echo_tool],
@@ -62,10 +66,8 @@ messages = [
 ]
 
 
-print(chat_model._to_chat_prompt(messages))
-
 # define your function normally, using `async def` instead of `def`
-async def chat():
+async def chat(chat_model):
     while True:
         message = chat_model.invoke(messages)
         text = message.text
@@ -78,5 +80,6 @@ async def chat():
         messages.append(HumanMessage(content=user_message))
 
 
-# use `asyncio.run` to call your async function to start the program
-asyncio.run(chat())
+if __name__ == "__main__":
+    # use `asyncio.run` to call your async function to start the program
+    asyncio.run(chat(load_chat_model()))
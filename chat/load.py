@@ -1,12 +1,12 @@
-from mlx_lm import load
-from mlx_lm import generate
+import sys
+
+from chat.daemon import ModelClient
 
 # Define your model to import
 model_name = "mlx-community/Meta-Llama-3-8B-Instruct-4bit"
 
-# Loading model
-model, tokenizer = load(model_name,
-                        tokenizer_config={"eos_token": "eot_id"} )
+# Llama 3 ends its turns with <|eot_id|>, not the tokenizer's default eos token
+tokenizer_config = {"eos_token": "eot_id"}
 
 # Define the role of the chatbot
 chatbot_role = "You are a call center assistant Susan which helps patients of St Antonius medical clinic with scheduling appointments."
@@ -22,14 +22,36 @@ messages = [
 ]
 
 
-# Apply the chat template to format the input for the model
-input_ids = tokenizer.apply_chat_template(messages, add_generation_prompt=True)
+def generate_local():
+    from mlx_lm import load, stream_generate
+
+    # Loading model
+    model, tokenizer = load(model_name,
+                            tokenizer_config=tokenizer_config)
+
+    # Apply the chat template to format the input for the model
+    input_ids = tokenizer.apply_chat_template(messages, add_generation_prompt=True)
+
+    # Decode the tokenized input back to text format to be used as a prompt for the model
+    prompt = tokenizer.decode(input_ids)
+
+    # Generate a response using the model
+    for chunk in stream_generate(model, tokenizer, max_tokens=512, prompt=prompt):
+        yield chunk.text
+
+
+def main():
+    # Attach to the model daemon (python -m chat.daemon) when it runs, --local loads the model here
+    if "--local" not in sys.argv and ModelClient.running():
+        response = ModelClient().generate(messages, model_name, max_tokens=512, tokenizer_config=tokenizer_config)
+    else:
+        response = generate_local()
 
-# Decode the tokenized input back to text format to be used as a prompt for the model
-prompt = tokenizer.decode(input_ids)
+    # Output the response as it's generated
+    for piece in response:
+        print(piece, end="", flush=True)
+    print()
 
-# Generate a response using the model
-response = generate(model, tokenizer, max_tokens=512, prompt=prompt)
 
-# Output the response
-print(response)
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,145 @@
+import asyncio
+import threading
+from collections import deque
+from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor
 from typing import AsyncIterable
 
-from kani import ChatMessage, AIFunction
+from kani import ChatMessage, ChatRole, AIFunction
 from kani.engines import BaseEngine
 from kani.engines.base import BaseCompletion, Completion
 from mlx_lm import load, generate, stream_generate
 import time
 
+from chat.prompt_cache import PromptCache
+from chat.context_budget import TokenCounter
+from chat.response_cache import ResponseCache
+
+STOP = ("<|eot_id|>",)  # Llama 3 end of turn, cut from the text when the tokenizer doesn't stop on it
+_DONE = object()
+
+def _held_back(text: str) -> int:
+    """Length of the tail of `text` that could be the start of a stop string"""
+    return max((n for stop in STOP for n in range(1, len(stop)) if text.endswith(stop[:n])), default=0)
+
 class MlxEngine(BaseEngine):
     def __init__(
             self,
-            model_id: str):
+            model_id: str,
+            max_sessions: int = 8,
+            response_cache: ResponseCache | None = None):
+        self.model_id = model_id
         self.model, self.tokenizer = load(model_id, tokenizer_config={"eos_token": "eot_id"} )
         self.max_context_size = 1024 * 8
+        # KV state of each session's previous turn, so a turn only prefills what's new
+        self.prompt_cache = PromptCache(self.model, max_sessions)
+        # MLX generation runs on one dedicated thread, so the event loop keeps serving other sessions
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="mlx-generate")
+        self.gaps = deque(maxlen=2000)  # seconds between consecutive streamed tokens
+        # kani asks for every message's length on every turn, each message is tokenized once
+        self.token_counter = TokenCounter(self.tokenizer.encode)
+        # replies to conversation states seen before (the call opening, common requests) are reused
+        self.response_cache = response_cache
 
-    async def predict(self, messages: list[ChatMessage], functions: list[AIFunction] | None = None,
-                      **hyperparams) -> BaseCompletion:
-        messages = [ {"role": m.role.name, "content": m.content} for m in messages ]
-        # Apply the chat template to format the input for the model
-        input_ids = self.tokenizer.apply_chat_template(messages)
+    def _generate(self, input_ids: list[int], session: str, max_tokens: int, emit, cancel: threading.Event) -> int:
+        """Runs on the worker thread, hands every piece of text to `emit`, returns the generated token count"""
+        start = time.perf_counter()
+        # Only the tokens after the longest prefix cached from the previous turn are prefilled
+        cache, new_ids = self.prompt_cache.prepare(session, input_ids)
+        tokens, pending, last = [], "", None
+        try:
+            for chunk in stream_generate(self.model, self.tokenizer, new_ids, max_tokens=max_tokens, prompt_cache=cache):
+                now = time.perf_counter()
+                if last is None: self.prompt_cache.first_token(start)
+                else: self.gaps.append(now - last)
+                last = now
+                tokens.append(chunk.token)
+                pending += chunk.text
+                if any(stop in pending for stop in STOP):
+                    if head := min((pending.split(stop, 1)[0] for stop in STOP if stop in pending), key=len): emit(head)
+                    pending = ""
+                    break
+                if n := len(pending) - _held_back(pending):
+                    emit(pending[:n])
+                    pending = pending[n:]
+                if cancel.is_set(): break
+            if pending: emit(pending)
+        finally:
+            self.prompt_cache.update(session, input_ids + tokens)
+        return len(tokens)
+
+    async def _tokens(self, input_ids: list[int], session: str, max_tokens: int, counts: dict) -> AsyncIterable[str]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancel = threading.Event()
+        emit = lambda item: loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        def work():
+            try: return self._generate(input_ids, session, max_tokens, emit, cancel)
+            finally: emit(_DONE)
 
-        # Decode the tokenized input back to text format to be used as a prompt for the model
-        prompt = self.tokenizer.decode(input_ids)
+        future = loop.run_in_executor(self.executor, work)
+        try:
+            while (item := await queue.get()) is not _DONE:
+                yield item
+            counts["completion"] = await future  # re-raises anything the worker raised
+        finally:
+            cancel.set()  # consumer stopped early or was cancelled, the worker ends after its current token
+            if not future.done():
+                # wait for it, so it doesn't emit into a closed loop and its exception is retrieved
+                with suppress(Exception): await future
 
-        # Generate a response using the model
-        start = time.time()
-        response = generate(self.model, self.tokenizer, max_tokens=512, prompt=prompt)
-        print(time.time()-start)
-        if "<|eot_id|>" in response:
-            response = response.split("<|eot_id|>")[0]
-        return Completion(ChatMessage.system(response))
+    async def predict(self, messages: list[ChatMessage], functions: list[AIFunction] | None = None,
+                      session: str = "default", **hyperparams) -> BaseCompletion:
+        completion = None
+        async for item in self.stream(messages, functions, session=session, **hyperparams):
+            if isinstance(item, BaseCompletion): completion = item
+        return completion
 
-    async def stream(self, messages: list[ChatMessage], functions: list[AIFunction] | None = None, **hyperparams) -> AsyncIterable[str | BaseCompletion]:
+    async def stream(self, messages: list[ChatMessage], functions: list[AIFunction] | None = None,
+                     session: str = "default", cache: bool = True, **hyperparams) -> AsyncIterable[str | BaseCompletion]:
+        """cache=False keeps this turn out of the response cache, as do function results as the last message"""
+        key = None
+        if self.response_cache is not None:
+            if cache and not (messages and messages[-1].role == ChatRole.FUNCTION):
+                key = ResponseCache.key(messages, self.model_id, hyperparams)
+                if (text := self.response_cache.get(key)) is not None:
+                    yield text
+                    yield Completion(ChatMessage.system(text))
+                    return
+            else:
+                self.response_cache.bypass()
         messages = [ {"role": m.role.name, "content": m.content} for m in messages ]
         # Apply the chat template to format the input for the model
         input_ids = self.tokenizer.apply_chat_template(messages)
 
-        # Decode the tokenized input back to text format to be used as a prompt for the model
-        prompt = self.tokenizer.decode(input_ids)
+        # Generate a response using the model, text is yielded as soon as each token is decoded
+        start = time.perf_counter()
+        counts, pieces = {}, []
+        async for piece in self._tokens(input_ids, session, hyperparams.get("max_tokens", 512), counts):
+            pieces.append(piece)
+            yield piece
+        if key is not None:
+            self.response_cache.put(key, "".join(pieces), time.perf_counter() - start)
+        yield Completion(ChatMessage.system("".join(pieces)), prompt_tokens=len(input_ids),
+                         completion_tokens=counts.get("completion"))
+
+    def drop_session(self, session: str):
+        """Frees the session's prompt cache once its call is over"""
+        self.prompt_cache.drop(session)
+
+    def cache_stats(self) -> dict:
+        return self.prompt_cache.stats()
 
-        # Generate a response using the model
-        start = time.time()
+    def stats(self) -> dict:
+        gaps = sorted(self.gaps)
+        return {**self.prompt_cache.stats(),
+                **({"response_cache": self.response_cache.stats()} if self.response_cache else {}),
+                "inter_token_mean_s": sum(gaps) / len(gaps) if gaps else None,
+                "inter_token_p95_s": gaps[int(0.95 * (len(gaps) - 1))] if gaps else None}
 
-        stream_generate(self.model, self.tokenizer, max_tokens=200, prompt=prompt)
+    async def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
     def message_len(self, message: ChatMessage) -> int:
-        return len(self.tokenizer.encode(message.text))
+        return self.token_counter(message)
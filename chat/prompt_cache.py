@@ -0,0 +1,82 @@
+"""
+Per-session prompt-prefix KV cache for mlx_lm generation.
+
+Every turn of a call re-sends the system prompt and the whole history, and plain `generate`
+prefills all of it again, so a turn gets slower the longer the call runs. Here each session
+keeps the KV cache of its previous prompt + reply together with the token ids it holds. On the
+next turn the cache is trimmed back to the longest prefix the new prompt shares with it, and
+only the tokens after that prefix are prefilled.
+"""
+import time
+from collections import OrderedDict, deque
+
+from mlx_lm.models.cache import can_trim_prompt_cache, make_prompt_cache, trim_prompt_cache
+
+
+def common_prefix(a: list[int], b: list[int]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class PromptCache:
+    def __init__(self, model, max_sessions: int = 8, history: int = 200):
+        """
+        model: the mlx_lm model the caches are made for
+        max_sessions: sessions kept at once, the least recently used one is evicted beyond this
+        """
+        self.model = model
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[str, tuple[list, list[int]]] = OrderedDict()  # session -> (kv cache, token ids in it)
+        self.prefilled = self.saved = self.evictions = 0
+        self.ttft = deque(maxlen=history)  # seconds from request to first token
+
+    def prepare(self, session: str, tokens: list[int]) -> tuple[list, list[int]]:
+        """Returns the session's KV cache and the part of `tokens` that still has to be prefilled."""
+        cache, cached = self.sessions.pop(session, (None, []))
+        # at least one token is always prefilled, generation starts from its logits
+        keep = min(common_prefix(cached, tokens), len(tokens) - 1)
+        if cache is not None and keep < len(cached):
+            if keep and can_trim_prompt_cache(cache):
+                trim_prompt_cache(cache, len(cached) - keep)
+            else:
+                cache = None
+        if cache is None:
+            cache, keep = make_prompt_cache(self.model), 0
+        self.sessions[session] = (cache, tokens[:keep])
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+            self.evictions += 1
+        self.prefilled += len(tokens) - keep
+        self.saved += keep
+        return cache, tokens[keep:]
+
+    def update(self, session: str, tokens: list[int]):
+        """Records the token ids now held by the session's cache (prompt + generated reply)."""
+        if session in self.sessions:
+            cache = self.sessions[session][0]
+            # the last sampled token is never fed back, so the cache may be one token short
+            self.sessions[session] = (cache, tokens[:cache[0].offset])
+
+    def first_token(self, started: float):
+        self.ttft.append(time.perf_counter() - started)
+
+    def drop(self, session: str):
+        """Frees a session's cache, e.g. when the call hangs up."""
+        self.sessions.pop(session, None)
+
+    def stats(self) -> dict:
+        ttft = sorted(self.ttft)
+        total = self.prefilled + self.saved
+        return {
+            "sessions": len(self.sessions),
+            "evictions": self.evictions,
+            "prefill_tokens": self.prefilled,
+            "prefill_tokens_saved": self.saved,
+            "saved_ratio": self.saved / total if total else 0.0,
+            "ttft_mean_s": sum(ttft) / len(ttft) if ttft else None,
+            "ttft_p95_s": ttft[int(0.95 * (len(ttft) - 1))] if ttft else None,
+        }
@@ -0,0 +1,133 @@
+"""
+Response cache for the utterances every call repeats.
+
+Each call opens with the same exchange ("Hello?"), and many later turns are close to identical
+("I'd like to book an appointment"). ResponseCache remembers the reply to a conversation state,
+keyed on the normalized messages (case, punctuation and spacing ignored) plus the model and its
+sampling parameters, so a repeated state is answered without running the model.
+
+Lookups are exact by default. With `similarity` set, a miss also compares the last message to
+recent entries whose earlier messages match exactly, using a hashed bag-of-words embedding (or
+your own `embed`), and reuses the reply when the cosine similarity reaches the threshold. Entries
+expire after `ttl` seconds and the least recently used ones are dropped beyond `max_entries`.
+
+A cached reply is only right if the turn depends on nothing but the conversation, so callers
+pass cache=False for turns that used a tool like get_current_time.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, Callable, NamedTuple, Optional
+
+import numpy as np
+
+from chat.context_budget import _key as message_key
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+
+
+def hashed_embedding(text: str, dim: int = 256) -> np.ndarray:
+    """Unit vector of the text's word unigrams and bigrams, hashed into `dim` buckets"""
+    words = text.split()
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in words + [a + " " + b for a, b in zip(words, words[1:])]:
+        h = zlib.crc32(feature.encode())
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class CacheKey(NamedTuple):
+    exact: str    # the whole normalized state
+    context: str  # everything but the last message, which must match exactly for a similar hit
+    last: str     # the normalized last message
+
+
+class _Entry(NamedTuple):
+    text: str
+    expires: float
+    seconds: float  # what generating the reply took, saved on every hit
+    context: str
+    vector: Optional[np.ndarray]
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, similarity: Optional[float] = None,
+                 max_similar: int = 256, embed: Callable[[str], np.ndarray] = hashed_embedding):
+        """
+        max_entries: replies kept, least recently used ones are dropped beyond this
+        ttl: seconds a reply is reused
+        similarity: cosine threshold for reusing the reply to a similar last message, None for exact matches only
+        max_similar: most recent entries compared on a similarity lookup
+        embed: normalized text -> unit vector
+        """
+        self.max_entries, self.ttl, self.similarity = max_entries, ttl, similarity
+        self.max_similar, self.embed = max_similar, embed
+        self.entries: OrderedDict[str, _Entry] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.similar_hits = self.misses = self.bypassed = 0
+        self.saved_s = 0.0
+
+    @staticmethod
+    def key(messages: list, model: str = "", params: Optional[dict] = None) -> CacheKey:
+        """messages: kani ChatMessages, langchain messages, role/content dicts or str (system)"""
+        state = [(str(role).lower(), normalize(text)) for role, text in map(message_key, messages)]
+        setup = json.dumps([model, params or {}], sort_keys=True, default=str)
+        digest = lambda items: hashlib.sha1(json.dumps([setup, items]).encode()).hexdigest()
+        return CacheKey(digest(state), digest(state[:-1]), state[-1][1] if state else "")
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        """The cached reply, or None"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key.exact)
+            if entry and entry.expires > now:
+                self.entries.move_to_end(key.exact)
+                self.hits += 1
+                self.saved_s += entry.seconds
+                return entry.text
+            if entry:
+                del self.entries[key.exact]
+            if self.similarity is not None and (entry := self._similar(key, now)):
+                self.similar_hits += 1
+                self.saved_s += entry.seconds
+                return entry.text
+            self.misses += 1
+            return None
+
+    def _similar(self, key: CacheKey, now: float) -> Optional[_Entry]:
+        recent = islice(reversed(self.entries.values()), self.max_similar)
+        candidates = [e for e in recent if e.context == key.context and e.vector is not None and e.expires > now]
+        if not candidates:
+            return None
+        scores = np.stack([e.vector for e in candidates]) @ self.embed(key.last)
+        best = int(np.argmax(scores))
+        return candidates[best] if scores[best] >= self.similarity else None
+
+    def put(self, key: CacheKey, text: str, seconds: float):
+        """seconds: how long generating `text` took"""
+        vector = self.embed(key.last) if self.similarity is not None else None
+        with self.lock:
+            self.entries[key.exact] = _Entry(text, time.monotonic() + self.ttl, seconds, key.context, vector)
+            self.entries.move_to_end(key.exact)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def bypass(self):
+        """Counts a turn that opted out of the cache"""
+        with self.lock:
+            self.bypassed += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.similar_hits + self.misses
+        return {"entries": len(self.entries), "hits": self.hits, "similar_hits": self.similar_hits,
+                "misses": self.misses, "bypassed": self.bypassed,
+                "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else None,
+                "saved_s": self.saved_s}
@@ -0,0 +1,62 @@
+"""
+Adapters that put the continuous batching scheduler (chat/scheduler.py) behind the two agent
+front ends, so concurrent callers share one batched model:
+
+    agent = ManualAgent(chat_model=ScheduledChat(scheduler))   # langchain-style .invoke(messages)
+    ai = Kani(ScheduledEngine(scheduler), system_prompt=...)   # kani engine
+"""
+import asyncio
+from typing import AsyncIterable
+
+from kani import ChatMessage, AIFunction
+from kani.engines import BaseEngine
+from kani.engines.base import BaseCompletion, Completion
+from langchain_core.messages import AIMessage, BaseMessage
+
+from chat.scheduler import BatchScheduler
+
+ROLES = {"system": "system", "human": "user", "ai": "assistant", "tool": "tool"}
+
+
+class ScheduledChat:
+    """Drop-in for ChatMLX in ManualAgent: blocking invoke(), batched with every other caller's."""
+
+    def __init__(self, scheduler: BatchScheduler, max_tokens: int = 128, temperature: float = 0.3,
+                 stop: tuple[str, ...] = ("\nFinal Answer:", "\nObservation:")):
+        self.scheduler = scheduler
+        self.options = {"max_tokens": max_tokens, "temperature": temperature, "stop": stop}
+
+    def invoke(self, messages: list[BaseMessage | str], **options) -> AIMessage:
+        # ManualAgent mixes plain strings (the system prompt) with message objects
+        messages = [{"role": "system", "content": m} if isinstance(m, str) else {"role": ROLES.get(m.type, "user"), "content": m.text}
+                    for m in messages]
+        ids = self.scheduler.tokenizer.apply_chat_template(messages, add_generation_prompt=True)
+        result = self.scheduler.submit(ids, **(self.options | options)).result()
+        return AIMessage(result["text"])
+
+
+class ScheduledEngine(BaseEngine):
+    def __init__(self, scheduler: BatchScheduler, max_context_size: int = 1024 * 8):
+        self.scheduler = scheduler
+        self.max_context_size = max_context_size
+
+    async def predict(self, messages: list[ChatMessage], functions: list[AIFunction] | None = None,
+                      **hyperparams) -> BaseCompletion:
+        ids = self.scheduler.tokenizer.apply_chat_template([{"role": m.role.name, "content": m.content} for m in messages],
+                                                           add_generation_prompt=True)
+        options = {k: hyperparams[k] for k in ("max_tokens", "temperature", "stop") if k in hyperparams}
+        result = await self.scheduler.generate(ids, **options)
+        return Completion(ChatMessage.assistant(result["text"]), prompt_tokens=len(ids),
+                          completion_tokens=len(result["tokens"]))
+
+    async def stream(self, messages: list[ChatMessage], functions: list[AIFunction] | None = None,
+                     **hyperparams) -> AsyncIterable[str | BaseCompletion]:
+        completion = await self.predict(messages, functions, **hyperparams)
+        yield completion.message.text
+        yield completion
+
+    def message_len(self, message: ChatMessage) -> int:
+        return len(self.scheduler.tokenizer.encode(message.text or ""))
+
+    async def close(self):
+        await asyncio.to_thread(self.scheduler.close)
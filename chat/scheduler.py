@@ -0,0 +1,228 @@
+"""
+Continuous batching for concurrent conversations on a Hugging Face causal LM.
+
+Every caller submits a request and waits for its result. A single scheduler thread owns the
+model and advances all running sequences together, one token per forward pass. New requests
+join the running batch between steps (after their own prefill), so they don't wait for the
+longest sequence in the batch to finish. Finished sequences leave the batch straight away.
+Sequences of different lengths share one left-padded KV cache with an attention mask, and the
+padding columns nobody needs any more are dropped when sequences leave.
+
+    python -m chat.scheduler --model sshleifer/tiny-gpt2 --requests 16    # CPU demo, batched vs one by one
+"""
+import argparse
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import torch
+from transformers import DynamicCache
+
+
+def _to_cache(kv):
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(kv)
+    return DynamicCache(kv)
+
+
+def _from_cache(cache) -> list:
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(cache.to_legacy_cache())
+
+
+def _left_pad(kv: list, mask: torch.Tensor, length: int):
+    """Pads a batch's KV cache and attention mask on the left to `length` positions."""
+    pad = length - mask.shape[1]
+    if not pad:
+        return kv, mask
+    kv = [tuple(torch.nn.functional.pad(t, (0, 0, pad, 0)) for t in layer) for layer in kv]
+    return kv, torch.nn.functional.pad(mask, (pad, 0))
+
+
+class GenerationRequest:
+    def __init__(self, ids: list[int], max_tokens: int, stop: tuple[str, ...], temperature: float):
+        self.ids, self.max_tokens, self.stop, self.temperature = ids, max_tokens, stop, temperature
+        self.future: Future = Future()
+        self.tokens: list[int] = []
+        self.text = ""
+        self.submitted = time.perf_counter()
+        self.started = self.finished = None
+
+
+class BatchScheduler:
+    def __init__(self, model, tokenizer, max_batch: int = 8, history: int = 1000):
+        """
+        model, tokenizer: a transformers causal LM and its tokenizer
+        max_batch: most sequences decoded together, later requests wait in the queue
+        """
+        self.model, self.tokenizer = model.eval(), tokenizer
+        self.max_batch = max_batch
+        self.eos = {tokenizer.eos_token_id} if tokenizer.eos_token_id is not None else set()
+        self.waiting: deque[GenerationRequest] = deque()
+        self.cond = threading.Condition()
+        self.running = True
+        self.active: list[GenerationRequest] = []
+        self.kv, self.mask = None, None  # batched KV cache and attention mask of the active sequences
+        self.steps = self.generated = 0
+        self.busy = 0.0
+        self.occupancy = deque(maxlen=history)  # active sequences per decode step
+        self.waits = deque(maxlen=history)      # seconds from submission to prefill
+        self.thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+        self.thread.start()
+
+    def submit(self, prompt: str | list[int], max_tokens: int = 256, stop: tuple[str, ...] = (),
+               temperature: float = 0.0) -> Future:
+        """Queues a request, the future resolves to {'text', 'tokens', 'finish_reason'}."""
+        ids = self.tokenizer.encode(prompt) if isinstance(prompt, str) else list(prompt)
+        request = GenerationRequest(ids, max_tokens, tuple(stop), temperature)
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("Scheduler is closed")
+            self.waiting.append(request)
+            self.cond.notify()
+        return request.future
+
+    async def generate(self, prompt: str | list[int], **options) -> dict:
+        return await asyncio.wrap_future(self.submit(prompt, **options))
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join()
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.waiting or self.active or not self.running)
+                if not self.running:
+                    break
+                admit = [self.waiting.popleft() for _ in range(min(len(self.waiting), self.max_batch - len(self.active)))]
+            start = time.perf_counter()
+            try:
+                with torch.no_grad():
+                    for request in admit:
+                        self._prefill(request)
+                    if self.active:
+                        self._step()
+            except Exception as e:  # fail the requests in flight, the scheduler keeps serving new ones
+                for request in self.active + admit:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                self.active, self.kv, self.mask = [], None, None
+            self.busy += time.perf_counter() - start
+        for request in self.active + list(self.waiting):
+            request.future.cancel()
+
+    def _sample(self, logits: torch.Tensor, request: GenerationRequest) -> int:
+        if request.temperature <= 0:
+            return int(logits.argmax())
+        return int(torch.multinomial(torch.softmax(logits / request.temperature, -1), 1))
+
+    def _prefill(self, request: GenerationRequest):
+        request.started = time.perf_counter()
+        self.waits.append(request.started - request.submitted)
+        out = self.model(torch.tensor([request.ids]), use_cache=True)
+        kv, mask = _from_cache(out.past_key_values), torch.ones(1, len(request.ids), dtype=torch.long)
+        self.active.append(request)
+        if self.kv is None:
+            self.kv, self.mask = kv, mask
+        else:
+            length = max(self.mask.shape[1], mask.shape[1])
+            (self.kv, self.mask), (kv, mask) = _left_pad(self.kv, self.mask, length), _left_pad(kv, mask, length)
+            self.kv = [tuple(torch.cat(pair) for pair in zip(a, b)) for a, b in zip(self.kv, kv)]
+            self.mask = torch.cat((self.mask, mask))
+        self._emit(request, self._sample(out.logits[0, -1], request))
+        self._retire()
+
+    def _step(self):
+        last = torch.tensor([[r.tokens[-1]] for r in self.active])
+        positions = self.mask.sum(1, keepdim=True)  # real tokens before the new one, pads don't count
+        self.mask = torch.cat((self.mask, torch.ones(len(self.active), 1, dtype=torch.long)), 1)
+        out = self.model(last, past_key_values=_to_cache(self.kv), attention_mask=self.mask, position_ids=positions, use_cache=True)
+        self.kv = _from_cache(out.past_key_values)
+        self.steps += 1
+        self.occupancy.append(len(self.active))
+        for i, request in enumerate(self.active):
+            self._emit(request, self._sample(out.logits[i, -1], request))
+        self._retire()
+
+    def _emit(self, request: GenerationRequest, token: int):
+        self.generated += 1
+        if token in self.eos:
+            request.finished = "stop"
+            return
+        request.tokens.append(token)
+        if request.stop:
+            request.text = self.tokenizer.decode(request.tokens)
+            if hits := [request.text.index(s) for s in request.stop if s in request.text]:
+                request.text, request.finished = request.text[:min(hits)], "stop"
+                return
+        if len(request.tokens) >= request.max_tokens:
+            request.finished = "length"
+
+    def _retire(self):
+        keep = [i for i, r in enumerate(self.active) if not r.finished]
+        if len(keep) == len(self.active):
+            return
+        for request in self.active:
+            if request.finished:
+                text = request.text if request.stop else self.tokenizer.decode(request.tokens)
+                request.future.set_result({"text": text, "tokens": request.tokens, "finish_reason": request.finished})
+        self.active = [self.active[i] for i in keep]
+        if not keep:
+            self.kv, self.mask = None, None
+            return
+        index = torch.tensor(keep)
+        self.kv = [tuple(t.index_select(0, index) for t in layer) for layer in self.kv]
+        self.mask = self.mask.index_select(0, index)
+        used = int(self.mask.any(0).long().argmax())  # leading columns that are padding for everyone left
+        if used:
+            self.kv = [tuple(t[:, :, used:] for t in layer) for layer in self.kv]
+            self.mask = self.mask[:, used:]
+
+    def stats(self) -> dict:
+        occupancy, waits = list(self.occupancy), sorted(self.waits)
+        return {
+            "queued": len(self.waiting),
+            "active": len(self.active),
+            "steps": self.steps,
+            "generated_tokens": self.generated,
+            "tokens_per_s": self.generated / self.busy if self.busy else 0.0,
+            "occupancy_mean": sum(occupancy) / len(occupancy) / self.max_batch if occupancy else 0.0,
+            "queue_wait_mean_s": sum(waits) / len(waits) if waits else 0.0,
+            "queue_wait_p95_s": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+        }
+
+
+def main():
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    parser = argparse.ArgumentParser(description="Continuous batching demo: concurrent requests, batched vs one by one")
+    parser.add_argument("--model", default="sshleifer/tiny-gpt2", help="Hugging Face causal LM (default: sshleifer/tiny-gpt2)")
+    parser.add_argument("--requests", type=int, default=16, help="Concurrent requests (default: 16)")
+    parser.add_argument("--max-batch", type=int, default=8, help="Sequences decoded together (default: 8)")
+    parser.add_argument("--max-tokens", type=int, default=32, help="Tokens per request, varied +-50%% (default: 32)")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model)
+    prompts = [f"Caller {i} would like to book an appointment for" + " next week" * (i % 4) for i in range(args.requests)]
+    lengths = [max(1, args.max_tokens // 2 + (i * 7) % args.max_tokens) for i in range(args.requests)]
+
+    for max_batch in (1, args.max_batch):
+        scheduler = BatchScheduler(model, tokenizer, max_batch)
+        start = time.perf_counter()
+        futures = [scheduler.submit(p, max_tokens=n) for p, n in zip(prompts, lengths)]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+        scheduler.close()
+        print(f"max_batch={max_batch}: {elapsed:.2f}s {scheduler.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Memory per idle session and bulk restore latency for chat/sessions.py.
+
+Builds N synthetic calls of --turns turns each, measures the memory they hold while live
+(tracemalloc) against the same histories kept as rendered message dicts, then evicts them all
+to disk and times restoring them in bulk.
+
+    python -m chat.session_bench --sessions 1000 10000 --tokenizer gpt2
+"""
+import argparse
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+
+from chat.sessions import SessionManager
+
+SYSTEM = ("You are a call center assistant Susan which helps patients of St Antonius medical clinic with "
+          "scheduling appointments. You ask questions one by one to not overload clients with many parallel questions.")
+WORDS = ("appointment clinic doctor tomorrow morning afternoon insurance card number prescription "
+         "schedule available Monday Tuesday please thank you could would like check results").split()
+
+
+class WordTokenizer:
+    """Stand-in tokenizer: one id per word or punctuation mark"""
+
+    def __init__(self):
+        self.ids, self.words = {}, []
+
+    def encode(self, text: str) -> list[int]:
+        ids = []
+        for word in re.findall(r"\w+|[^\w\s]", text):
+            if word not in self.ids:
+                self.ids[word] = len(self.words)
+                self.words.append(word)
+            ids.append(self.ids[word])
+        return ids
+
+    def decode(self, ids: list[int]) -> str:
+        return " ".join(self.words[i] for i in ids)
+
+
+def turns(rng: random.Random, count: int) -> list[dict]:
+    return [{"role": "user" if i % 2 == 0 else "assistant",
+             "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))} for i in range(count)]
+
+
+def measure(build) -> tuple[int, object]:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session memory and restore latency")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 10000], help="Session counts (default: 1000 10000)")
+    parser.add_argument("--turns", type=int, default=20, help="Turns per session (default: 20)")
+    parser.add_argument("--tokenizer", help="Hugging Face tokenizer (default: a word-level stand-in)")
+    args = parser.parse_args()
+
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+        encode = lambda text: tokenizer.encode(text, add_special_tokens=False)
+        decode = tokenizer.decode
+    else:
+        tokenizer = WordTokenizer()
+        encode, decode = tokenizer.encode, tokenizer.decode
+
+    print(f"{'sessions':>8} {'dicts B/session':>16} {'compact B/session':>18} {'evict s':>8} {'restore s':>10} {'restore ms/1k':>14}")
+    for count in args.sessions:
+        rng = random.Random(0)
+        calls = {f"call-{i}": turns(rng, args.turns) for i in range(count)}
+        encode(" ".join(WORDS))  # the stand-in tokenizer's vocabulary isn't session state
+
+        # the rendered strings each agent would hold (copied, so they are counted), the system prompt shared
+        plain, _ = measure(lambda: {sid: [{"role": "system", "content": SYSTEM}] +
+                                    [{"role": m["role"], "content": m["content"].encode().decode()} for m in history]
+                                    for sid, history in calls.items()})
+        with tempfile.TemporaryDirectory() as directory:
+            manager = SessionManager(encode, decode, directory, max_live=count + 1)
+
+            def build():
+                for sid, history in calls.items():
+                    session = manager.get(sid, SYSTEM)
+                    for message in history:
+                        session.append(message)
+                return manager
+
+            compact, _ = measure(build)
+            start = time.perf_counter()
+            manager.evict_all()
+            evict = time.perf_counter() - start
+            start = time.perf_counter()
+            restored = manager.restore(calls)
+            restore = time.perf_counter() - start
+            assert restored == count
+            sid = next(iter(calls))
+            assert [m["content"] for m in manager.get(sid, SYSTEM)][1:] == [decode(encode(m["content"])) for m in calls[sid]]
+        print(f"{count:8d} {plain / count:16.0f} {compact / count:18.0f} {evict:8.2f} {restore:10.2f} {1000 * restore / count * 1000:14.1f}")
+
+
+if __name__ == "__main__":
+    main()
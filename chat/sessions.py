@@ -0,0 +1,230 @@
+"""
+Per-call conversation state for many concurrent ManualAgent conversations.
+
+A Session keeps a call's history compactly: the system prompt is interned and shared by every
+session that uses it, and each turn is stored as a role code plus its token ids in a uint32
+array instead of rendered message objects. Messages are only rebuilt when the history is sent
+to the model. Every session shares the single loaded model; only this state is per call.
+
+SessionManager keeps recently used sessions in memory. Sessions idle longer than `idle_seconds`,
+or beyond `max_live`, are written to disk (atomically, as in transcript/cache.py) and dropped
+from memory. restore() brings back many of them at once with parallel reads, e.g. after a
+restart.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator
+
+ROLES = {"system": "s", "human": "h", "ai": "a", "tool": "t", "user": "h", "assistant": "a"}
+NAMES = {"s": "system", "h": "human", "a": "ai", "t": "tool"}
+
+
+def _role(message: Any) -> str:
+    if isinstance(message, dict):
+        return ROLES.get(message.get("role"), "h")
+    return ROLES.get(getattr(message, "type", None) or getattr(message, "role", ""), "h")
+
+
+def _text(message: Any) -> str:
+    if isinstance(message, dict):
+        return message.get("content") or ""
+    text = getattr(message, "text", None)
+    return text if isinstance(text, str) else str(getattr(message, "content", ""))
+
+
+def as_dict(role: str, text: str) -> dict:
+    return {"role": role, "content": text}
+
+
+def as_message(role: str, text: str) -> Any:
+    """langchain messages, which ManualAgent's single-pass mode needs"""
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+    if role == "tool":
+        return ToolMessage(text, tool_call_id="")
+    return {"system": SystemMessage, "human": HumanMessage, "ai": AIMessage}[role](text)
+
+
+def _plain(encode: Callable[..., list[int]]) -> Callable[[str], list[int]]:
+    """encode without special tokens: HF tokenizers add BOS (and some EOS) by default, which
+    would be stored as part of every turn and decoded back into its text"""
+    try:
+        encode("", add_special_tokens=False)
+    except TypeError:
+        return encode
+    return lambda text: encode(text, add_special_tokens=False)
+
+
+class Session:
+    """A conversation history that can stand in for ManualAgent.messages (append, iterate, len)."""
+    __slots__ = ("id", "system", "roles", "lengths", "tokens", "last_used", "manager")
+
+    def __init__(self, session_id: str, system: str, manager: "SessionManager"):
+        self.id = session_id
+        self.system = sys.intern(system)  # one copy per distinct prompt, not per call
+        self.roles = bytearray()          # one role code per turn
+        self.lengths = array("I")         # tokens per turn
+        self.tokens = array("I")          # all turns' token ids, back to back
+        self.last_used = time.time()
+        self.manager = manager
+
+    def append(self, message: Any):
+        ids = self.manager.encode(_text(message))
+        self.roles.append(ord(_role(message)))
+        self.lengths.append(len(ids))
+        self.tokens.extend(ids)
+        self.last_used = time.time()
+
+    def __len__(self) -> int:
+        return len(self.roles) + 1
+
+    def __iter__(self) -> Iterator:
+        render, decode = self.manager.render, self.manager.decode
+        yield render("system", self.system)
+        start = 0
+        for role, length in zip(self.roles, self.lengths):
+            yield render(NAMES[chr(role)], decode(self.tokens[start:start + length].tolist()))
+            start += length
+
+    def nbytes(self) -> int:
+        """Memory held by this session's own state (the interned prompt is shared, so not counted)"""
+        return (sys.getsizeof(self) + sys.getsizeof(self.roles) + sys.getsizeof(self.lengths)
+                + sys.getsizeof(self.tokens) + sys.getsizeof(self.id))
+
+
+class SessionManager:
+    def __init__(self, encode: Callable[[str], list[int]], decode: Callable[[list[int]], str], directory: str,
+                 max_live: int = 10_000, idle_seconds: float = 300.0, render: Callable[[str, str], Any] = as_dict):
+        """
+        encode, decode: the shared model's tokenizer functions, e.g. tokenizer.encode and
+                tokenizer.decode; encode must not add special tokens (add_special_tokens=False is
+                passed when it takes it), so that decode(encode(text)) gives the text back
+        directory: where evicted sessions are kept
+        max_live: sessions kept in memory, least recently used ones are evicted beyond this
+        idle_seconds: sessions unused for longer are evicted by evict_idle()
+        render: (role, text) -> message for the chat model, role is system/human/ai/tool;
+                as_dict for role/content dicts, as_message for langchain messages
+        """
+        self.encode, self.decode, self.render = _plain(encode), decode, render
+        if self.encode(""):
+            raise ValueError("encode adds special tokens to every text, stored turns wouldn't decode back to their text")
+        self.directory, self.max_live, self.idle_seconds = directory, max_live, idle_seconds
+        self.live: OrderedDict[str, Session] = OrderedDict()
+        self.prompts: dict[str, str] = {}  # hash -> system prompt, shared by every stored session
+        self.lock = threading.RLock()
+        self.evicted = self.restored = 0
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(os.path.join(directory, "prompts.json")) as f:
+                self.prompts = json.load(f)
+        except FileNotFoundError:
+            pass
+
+    def _path(self, session_id: str) -> str:
+        key = hashlib.sha1(session_id.encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], key + ".session")
+
+    def get(self, session_id: str, system: str) -> Session:
+        """The live session, restored from disk if it was evicted, or a new one."""
+        with self.lock:
+            if (session := self.live.get(session_id)) is None:
+                if session := self._load(session_id):
+                    self.restored += 1
+                else:
+                    session = Session(session_id, system, self)
+                self._add(session)
+            self.live.move_to_end(session_id)
+            session.last_used = time.time()
+            return session
+
+    def _add(self, session: Session):
+        self.live[session.id] = session
+        while len(self.live) > self.max_live:
+            self._evict(next(iter(self.live)))
+
+    def end(self, session_id: str):
+        """Forgets a finished call, in memory and on disk."""
+        with self.lock:
+            self.live.pop(session_id, None)
+            try:
+                os.unlink(self._path(session_id))
+            except FileNotFoundError:
+                pass
+
+    def evict_idle(self) -> int:
+        """Writes sessions idle longer than idle_seconds to disk, returns how many."""
+        cutoff = time.time() - self.idle_seconds
+        with self.lock:
+            idle = [sid for sid, s in self.live.items() if s.last_used < cutoff]
+            for session_id in idle:
+                self._evict(session_id)
+        return len(idle)
+
+    def evict_all(self):
+        with self.lock:
+            for session_id in list(self.live):
+                self._evict(session_id)
+
+    def _evict(self, session_id: str):
+        session = self.live.pop(session_id)
+        prompt = hashlib.sha1(session.system.encode()).hexdigest()[:16]
+        if prompt not in self.prompts:
+            self.prompts[prompt] = session.system
+            self._write(os.path.join(self.directory, "prompts.json"), json.dumps(self.prompts).encode())
+        header = {"id": session.id, "system": prompt, "roles": session.roles.decode(),
+                  "lengths": session.lengths.tolist(), "last_used": session.last_used}
+        self._write(self._path(session_id), json.dumps(header).encode() + b"\n" + session.tokens.tobytes())
+        self.evicted += 1
+
+    def _write(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _load(self, session_id: str) -> Session | None:
+        try:
+            with open(self._path(session_id), "rb") as f:
+                header, tokens = f.read().split(b"\n", 1)
+        except FileNotFoundError:
+            return None
+        header = json.loads(header)
+        session = Session(header["id"], self.prompts[header["system"]], self)
+        session.roles = bytearray(header["roles"].encode())
+        session.lengths = array("I", header["lengths"])
+        session.tokens = array("I")
+        session.tokens.frombytes(tokens)
+        session.last_used = header["last_used"]
+        return session
+
+    def restore(self, session_ids: Iterable[str], workers: int = 8) -> int:
+        """Loads many evicted sessions back into memory with parallel reads, returns how many were found.
+        Sessions that are already live are kept, their copy on disk is older."""
+        with self.lock:
+            session_ids = [sid for sid in session_ids if sid not in self.live]
+        with ThreadPoolExecutor(workers) as pool:
+            sessions = [s for s in pool.map(self._load, session_ids) if s is not None]
+        with self.lock:
+            sessions = [s for s in sessions if s.id not in self.live]  # got live again while reading
+            for session in sessions:
+                self._add(session)
+            self.restored += len(sessions)
+        return len(sessions)
+
+    def stats(self) -> dict:
+        with self.lock:
+            live = list(self.live.values())
+        return {"live": len(live), "evicted": self.evicted, "restored": self.restored,
+                "live_bytes": sum(s.nbytes() for s in live), "prompts": len({id(s.system) for s in live})}
@@ -0,0 +1,80 @@
+"""
+Cold vs warm startup to first response for the chat scripts.
+
+cold: a fresh `python -m chat.load --local`, which imports mlx_lm and loads the model itself
+warm: the same script while chat/daemon.py holds the model, so it only attaches to the socket
+Also times `import chat.ManualAgent`, which used to load the chat model as a side effect.
+
+    python -m chat.startup_bench --runs 3
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from chat.daemon import ModelClient
+from chat.load import model_name, tokenizer_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def first_output(command: list[str], env: dict) -> tuple[float, float]:
+    """Seconds from starting `command` to its first byte of output, and to its exit"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=ROOT, env=env)
+    proc.stdout.read(1)
+    first = time.perf_counter() - start
+    proc.stdout.read()
+    if proc.wait():
+        raise RuntimeError(f"{' '.join(command)} exited with {proc.returncode}")
+    return first, time.perf_counter() - start
+
+
+def start_daemon(path: str, env: dict, timeout: float = 600.0) -> subprocess.Popen:
+    daemon = subprocess.Popen([sys.executable, "-m", "chat.daemon", "--socket", path], cwd=ROOT, env=env)
+    deadline = time.monotonic() + timeout
+    while not ModelClient.running(path):
+        if daemon.poll() is not None or time.monotonic() > deadline:
+            daemon.kill()
+            raise RuntimeError("model daemon didn't start")
+        time.sleep(0.05)
+    client = ModelClient(path)
+    client.load(llm=[(model_name, tokenizer_config)])  # blocks until the model is loaded
+    client.close()
+    return daemon
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold vs warm startup to first response")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per row, the median is shown (default: 3)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "models.sock")
+        env = dict(os.environ, CALL_CENTER_DAEMON=path)
+        rows = {}
+        rows["import chat.ManualAgent"] = [first_output([sys.executable, "-c", "import chat.ManualAgent; print('ok')"], env)
+                                           for _ in range(args.runs)]
+        rows["cold: python -m chat.load --local"] = [first_output([sys.executable, "-m", "chat.load", "--local"], env)
+                                                     for _ in range(args.runs)]
+        start = time.perf_counter()
+        daemon = start_daemon(path, env)
+        daemon_ready = time.perf_counter() - start
+        try:
+            rows["warm: python -m chat.load"] = [first_output([sys.executable, "-m", "chat.load"], env)
+                                                 for _ in range(args.runs)]
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    print(f"daemon start + model load, paid once: {daemon_ready:.2f}s")
+    print(f"{'':36} {'first output s':>15} {'total s':>8}")
+    for name, runs in rows.items():
+        print(f"{name:36} {statistics.median(r[0] for r in runs):15.2f} {statistics.median(r[1] for r in runs):8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Concurrent, cached and time-bounded tool execution for ManualAgent.
+
+Tool calls from one model reply are independent, so they run concurrently on an event loop
+that lives in a background thread (the agent itself is synchronous). Per-tool options are
+declared next to the schema in TOOLS, as an optional third tuple element:
+
+    "search": (tool_search, {"query": str}, {"timeout": 5.0, "ttl": 300}),
+
+timeout: seconds before the caller gets an error result instead of waiting any longer
+ttl: seconds a result is reused for identical arguments, 0 (default) disables caching
+
+Identical calls that are already running are merged into one. Every call goes through `invoke`
+(argument casting, unknown-tool and bad-argument errors). Synchronous tools run in a thread pool,
+and `async def` tools, for which `invoke` returns the coroutine, run on the loop directly. A
+timed-out synchronous tool can't be interrupted: its thread runs to completion in the background
+and its result is dropped.
+"""
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Tuple
+
+DEFAULT_TIMEOUT = 10.0
+
+
+def tool_options(spec: tuple) -> Dict[str, float]:
+    return spec[2] if len(spec) > 2 else {}
+
+
+class ToolExecutor:
+    def __init__(self, tools: Dict[str, tuple], invoke: Callable[[str, dict], str], max_workers: int = 8,
+                 history: int = 1000):
+        """
+        tools: name -> (function, {param: type}[, {"timeout": s, "ttl": s}])
+        invoke: runs one call synchronously, e.g. ManualAgent.run_tool (argument casting, errors),
+                returning the coroutine for an async tool
+        max_workers: threads for synchronous tools
+        """
+        self.tools, self.invoke = tools, invoke
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers, "tool"))
+        self.thread = threading.Thread(target=self.loop.run_forever, name="tool-executor", daemon=True)
+        self.thread.start()
+        self.cache: Dict[tuple, Tuple[float, str]] = {}  # key -> (expires, result)
+        self.inflight: Dict[tuple, asyncio.Future] = {}
+        self.counts = defaultdict(lambda: defaultdict(int))  # tool -> calls, cache_hits, merged, timeouts, errors
+        self.latency = defaultdict(lambda: deque(maxlen=history))  # tool -> seconds per executed call
+
+    def run_all(self, calls: list[Tuple[str, dict]]) -> list[str]:
+        """Runs the calls concurrently and returns their results in order (blocking)."""
+        return asyncio.run_coroutine_threadsafe(self.gather(calls), self.loop).result()
+
+    async def gather(self, calls: list[Tuple[str, dict]]) -> list[str]:
+        return list(await asyncio.gather(*(self.call(name, args) for name, args in calls)))
+
+    async def call(self, name: str, args: dict) -> str:
+        counts = self.counts[name]
+        counts["calls"] += 1
+        key = (name, json.dumps(args, sort_keys=True, default=str))
+        if (cached := self.cache.get(key)) and cached[0] > time.monotonic():
+            counts["cache_hits"] += 1
+            return cached[1]
+        if key in self.inflight:
+            counts["merged"] += 1
+            return (await asyncio.shield(self.inflight[key]))[0]
+        self.inflight[key] = future = self.loop.create_task(self._execute(name, args))
+        try:
+            result, ok = await asyncio.shield(future)
+        finally:
+            self.inflight.pop(key, None)
+        ttl = tool_options(self.tools.get(name, ())).get("ttl", 0)
+        if ok and ttl:
+            now = time.monotonic()
+            if len(self.cache) >= 1024:  # expired entries are only looked at when the cache grows
+                self.cache = {k: v for k, v in self.cache.items() if v[0] > now}
+            self.cache[key] = (now + ttl, result)
+        return result
+
+    async def _execute(self, name: str, args: dict) -> Tuple[str, bool]:
+        options = tool_options(self.tools.get(name, ()))
+        timeout = options.get("timeout", DEFAULT_TIMEOUT)
+        func = self.tools[name][0] if name in self.tools else None
+        start = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(func):
+                result = self.invoke(name, args)  # checks and casts the args, an error comes back as text
+                if asyncio.iscoroutine(result):
+                    result = await asyncio.wait_for(result, timeout)
+            else:
+                result = await asyncio.wait_for(self.loop.run_in_executor(None, self.invoke, name, args), timeout)
+            return str(result), True
+        except asyncio.TimeoutError:
+            self.counts[name]["timeouts"] += 1
+            return f"Error: tool {name} timed out after {timeout:g}s", False
+        except Exception as e:
+            self.counts[name]["errors"] += 1
+            return f"Failed to call tool {name}: {e}", False
+        finally:
+            self.latency[name].append(time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        stats = {}
+        for name, counts in self.counts.items():
+            seconds = sorted(self.latency[name])
+            stats[name] = dict(counts, p50_s=seconds[len(seconds) // 2] if seconds else None,
+                               p95_s=seconds[min(len(seconds) - 1, int(0.95 * len(seconds)))] if seconds else None)
+        return stats
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,242 @@
+"""
+Constrained decoding of tool calls, derived from the TOOLS schemas in ManualAgent.
+
+The model may either answer in plain text or emit a tool call list such as
+    [{"name": "add", "params": {"a": 2, "b": 3}}]
+Once its reply starts with '[' or '{', ToolCallConstraint masks every token that would take the
+JSON off the grammar: unknown tool names, missing or unknown parameters, values of the wrong
+type. Checking is done on the decoded text with a prefix validator, and only for the top-K
+tokens, so it's cheap enough to run on every step. It's a logits processor in the mlx_lm
+signature, processor(tokens, logits) -> logits, and also works with torch tensors.
+"""
+import re
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+
+INVALID, PARTIAL, COMPLETE = "invalid", "partial", "complete"
+
+_NUMBER = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?")
+_INTEGER = re.compile(r"-?(0|[1-9]\d*)")
+_ESCAPES = set('"\\/bfnrtu')
+
+
+class _Incomplete(Exception):
+    pass
+
+
+class _Invalid(Exception):
+    pass
+
+
+class _Parser:
+    def __init__(self, text: str, tools: Dict[str, Tuple[Callable[..., str], Dict[str, type]]]):
+        self.text, self.i, self.tools = text, 0, tools
+
+    def peek(self) -> str:
+        if self.i >= len(self.text):
+            raise _Incomplete
+        return self.text[self.i]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise _Invalid
+        self.i += 1
+
+    def ws(self):
+        while self.i < len(self.text) and self.text[self.i] in " \t\r\n":
+            self.i += 1
+
+    def calls(self):
+        if self.peek() == "{":
+            return self.call()
+        self.expect("[")
+        while True:
+            self.ws()
+            self.call()
+            self.ws()
+            if self.peek() == "]":
+                self.i += 1
+                return
+            self.expect(",")
+
+    def call(self):
+        self.expect("{")
+        self.ws()
+        self.choice(["name"])
+        self.ws()
+        self.expect(":")
+        self.ws()
+        name = self.choice(sorted(self.tools))
+        self.ws()
+        self.expect(",")
+        self.ws()
+        self.choice(["params"])
+        self.ws()
+        self.expect(":")
+        self.ws()
+        self.params(self.tools[name][1])
+        self.ws()
+        self.expect("}")
+
+    def params(self, schema: Dict[str, type]):
+        self.expect("{")
+        remaining = set(schema)
+        self.ws()
+        if not remaining:
+            return self.expect("}")
+        while True:
+            key = self.choice(sorted(remaining))
+            remaining.discard(key)
+            self.ws()
+            self.expect(":")
+            self.ws()
+            self.value(schema[key])
+            self.ws()
+            if not remaining:
+                return self.expect("}")
+            self.expect(",")
+            self.ws()
+
+    def choice(self, options: list[str]) -> str:
+        """A string that must be one of `options`"""
+        self.expect('"')
+        start = self.i
+        while True:
+            if self.i >= len(self.text):
+                if not any(o.startswith(self.text[start:]) for o in options):
+                    raise _Invalid
+                raise _Incomplete
+            if self.text[self.i] == '"':
+                value = self.text[start:self.i]
+                if value not in options:
+                    raise _Invalid
+                self.i += 1
+                return value
+            self.i += 1
+
+    def value(self, kind: type):
+        if kind in (int, float):
+            return self.number(_INTEGER if kind is int else _NUMBER)
+        if kind is bool:
+            return self.literal(("true", "false"))
+        return self.string()
+
+    def number(self, pattern: re.Pattern):
+        start = self.i
+        while self.i < len(self.text) and self.text[self.i] in "+-.eE0123456789":
+            self.i += 1
+        token = self.text[start:self.i]
+        if self.i >= len(self.text):
+            # could still grow, it only has to be a prefix of a number
+            if token and not re.fullmatch(r"-?((0|[1-9]\d*)(\.\d*)?([eE][+-]?\d*)?)?", token):
+                raise _Invalid
+            if pattern is _INTEGER and re.search(r"[.eE]", token):
+                raise _Invalid
+            raise _Incomplete
+        if not pattern.fullmatch(token):
+            raise _Invalid
+
+    def literal(self, options: tuple[str, ...]):
+        rest = self.text[self.i:]
+        for option in options:
+            if rest.startswith(option):
+                self.i += len(option)
+                return
+            if option.startswith(rest):
+                raise _Incomplete
+        raise _Invalid
+
+    def string(self):
+        self.expect('"')
+        while True:
+            char = self.peek()
+            self.i += 1
+            if char == '"':
+                return
+            if char == "\\":
+                escape = self.peek()
+                if escape not in _ESCAPES:
+                    raise _Invalid
+                self.i += 1
+                if escape == "u":
+                    digits = self.text[self.i:self.i + 4]
+                    if not re.fullmatch(r"[0-9a-fA-F]*", digits):
+                        raise _Invalid
+                    if len(digits) < 4:
+                        raise _Incomplete
+                    self.i += 4
+            elif ord(char) < 0x20:
+                raise _Invalid
+
+
+def check(text: str, tools: Dict[str, Tuple[Callable[..., str], Dict[str, type]]]) -> str:
+    """Whether `text` is a complete tool call list, a valid prefix of one, or neither"""
+    parser = _Parser(text.lstrip(), tools)
+    try:
+        parser.calls()
+        parser.ws()
+    except _Incomplete:
+        return PARTIAL
+    except _Invalid:
+        return INVALID
+    return COMPLETE if parser.i == len(parser.text) else INVALID
+
+
+def _bias_like(logits: Any, bias: np.ndarray) -> Any:
+    module = type(logits).__module__
+    if module.startswith("torch"):
+        import torch
+        return torch.from_numpy(bias).to(device=logits.device, dtype=logits.dtype)
+    if module.startswith("mlx"):
+        import mlx.core as mx
+        return mx.array(bias).astype(logits.dtype)
+    return bias
+
+
+class ToolCallConstraint:
+    def __init__(self, tokenizer, tools: Dict[str, Tuple[Callable[..., str], Dict[str, type]]], top_k: int = 32):
+        """
+        tokenizer: the model's tokenizer (decode, eos_token_id)
+        tools: name -> (function, {param: type}), as in ManualAgent.TOOLS
+        top_k: candidate tokens checked per step, the rest are masked while inside a tool call
+        """
+        self.tokenizer, self.tools, self.top_k = tokenizer, tools, top_k
+        eos = getattr(tokenizer, "eos_token_ids", None) or {tokenizer.eos_token_id}
+        self.eos = sorted(t for t in eos if t is not None)
+        self.prompt_len = None
+        self.masked_steps = 0
+
+    def __call__(self, tokens: Any, logits: Any) -> Any:
+        tokens = tokens.tolist() if hasattr(tokens, "tolist") else list(tokens)
+        if tokens and isinstance(tokens[0], list):  # batch of one, as transformers passes it
+            tokens = tokens[0]
+        if self.prompt_len is None:  # the first call sees only the prompt
+            self.prompt_len = len(tokens)
+        generated = tokens[self.prompt_len:]
+        text = self.tokenizer.decode(generated).lstrip()
+        if text and text[0] not in "[{":
+            return logits  # a plain answer, nothing to constrain
+        scores = np.array(logits, dtype=np.float32).reshape(-1)
+        state = check(text, self.tools) if text else PARTIAL
+        if state == COMPLETE:
+            allowed = self.eos
+        else:
+            allowed = []
+            for token in np.argsort(-scores)[:self.top_k].tolist():
+                if token in self.eos:
+                    continue  # ending now would leave the call unfinished
+                candidate = self.tokenizer.decode(generated + [token]).lstrip()
+                if not candidate:
+                    allowed.append(token)  # leading whitespace
+                elif candidate[0] not in "[{":
+                    if not text:
+                        allowed.append(token)  # the reply may still start as a plain answer
+                elif check(candidate, self.tools) != INVALID:
+                    allowed.append(token)
+            if not allowed and text:
+                return logits  # nothing valid among the top K, better unconstrained than stuck
+        self.masked_steps += 1
+        bias = np.full(scores.shape, -np.inf, dtype=np.float32)
+        bias[allowed] = 0.0
+        return logits + _bias_like(logits, bias.reshape(np.shape(logits)))
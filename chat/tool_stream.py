@@ -0,0 +1,87 @@
+"""
+Incremental tool-call detection on a streamed model reply.
+
+ManualAgent used to wait for the whole reply before looking at it. ToolCallStream is fed the
+reply piece by piece as tokens are decoded. The first non-blank character decides the mode: '['
+or '{' means a tool call list, anything else is prose and passes straight through, so speech
+output can start with the first words. In tool mode, brackets are tracked (skipping string
+contents), and every call object is handed to `on_call` as soon as its closing brace arrives.
+The tool then runs while the model is still generating the rest of the list.
+"""
+from typing import Any, Callable, Dict, Optional
+
+UNDECIDED, PROSE, TOOLS = "undecided", "prose", "tools"
+
+
+class ToolCallStream:
+    def __init__(self, on_call: Callable[[str, Dict[str, Any]], None], parse: Callable[[str], Any]):
+        """
+        on_call: called with (name, params) for every complete call object, in order
+        parse: object text -> dict or None, e.g. ManualAgent.try_parse_json_block
+        """
+        self.on_call, self.parse = on_call, parse
+        self.mode = UNDECIDED
+        self.text = ""          # everything fed so far
+        self.depth = 0          # bracket nesting outside of strings
+        self.level = 1          # nesting at which call objects open
+        self.quote: Optional[str] = None  # the delimiter of the string we're in, JSON or Python style
+        self.escaped = False
+        self.start = None       # where the current call object began
+        self.calls = 0
+        self.errors: list[str] = []  # call objects that didn't parse
+
+    def feed(self, piece: str) -> str:
+        """Consumes a piece of the reply, returns the part of it that is prose to pass on."""
+        offset = len(self.text)
+        self.text += piece
+        if self.mode == UNDECIDED:
+            stripped = self.text.lstrip()
+            if not stripped:
+                return ""
+            if stripped[0] not in "[{":
+                self.mode = PROSE
+                return self.text  # including the blanks held back while undecided
+            self.mode = TOOLS
+            self.level = 0 if stripped[0] == "{" else 1  # a bare object is one call, in a list each object at depth 1 is
+            offset = len(self.text) - len(stripped)
+        if self.mode == PROSE:
+            return piece
+        self._scan(offset)
+        return ""
+
+    def _scan(self, offset: int):
+        for i in range(offset, len(self.text)):
+            char = self.text[i]
+            if self.quote:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == self.quote:
+                    self.quote = None
+                continue
+            if char in "\"'":
+                self.quote = char
+            elif char in "[{":
+                if char == "{" and self.depth == self.level:
+                    self.start = i
+                self.depth += 1
+            elif char in "]}":
+                self.depth -= 1
+                if char == "}" and self.depth == self.level and self.start is not None:
+                    self._call(self.text[self.start:i + 1])
+                    self.start = None
+
+    def _call(self, text: str):
+        item = self.parse(text)
+        if isinstance(item, dict) and "name" in item:
+            self.calls += 1
+            self.on_call(item["name"], item.get("params") or {})
+        else:
+            self.errors.append(text)
+
+    def finish(self) -> bool:
+        """Call once the reply is complete, returns whether it was a tool call reply."""
+        if self.mode == TOOLS and self.start is not None:
+            self.errors.append(self.text[self.start:])  # cut off mid-object
+        return self.mode == TOOLS
@@ -4,7 +4,7 @@ from bs4 import BeautifulSoup
 from subprocess import call
 import wikipedia, requests
 import pyttsx3, mediactl
-import time, os, re
+import time, re
 #import webbrowser #wip might use later
 
 # My simple AI assistant using my LiveWhisper as a base. Can perform simple tasks such as:
@@ -24,6 +24,8 @@ BlockSize = 30      # Block size in milliseconds
 Threshold = 0.1     # Minimum volume threshold to activate listening
 Vocals = [50, 1000] # Frequency range to detect sounds that could be speech
 EndBlocks = 40      # Number of blocks to wait before sending to Whisper
+VadEngine = 'dominant' # Speech detector: 'dominant', 'energy', 'band' or 'zcr' (see vad.py)
+Streaming = False   # Print partial transcripts while still talking (see streaming.py)
 
 class Assistant:
     def __init__(self):
@@ -158,12 +160,11 @@ class Assistant:
 def main():
     try:
         AIstant = Assistant() #voice object before this?
-        handler = StreamHandler(AIstant)
+        handler = StreamHandler(AIstant, vad=VadEngine, streaming=Streaming)
         handler.listen()
     except (KeyboardInterrupt, SystemExit): pass
     finally:
         print("\n\033[93mQuitting..\033[0m")
-        if os.path.exists('dictate.wav'): os.remove('dictate.wav')
 
 if __name__ == '__main__':
     main()  # by Nik
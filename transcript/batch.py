@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Batch transcription over a pool of worker processes
+
+Used by transcribe_audio.py and transcribe_audio_mlx.py when they get more than one input.
+Inputs can be files, directories (searched recursively), globs or a manifest listing one path
+per line (plain text, or JSONL with a "path" field). Each worker process loads the model once
+and keeps it, results are appended to a JSONL file as files finish, in completion order.
+"""
+
+import glob
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+from cache import TranscriptCache
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".aac", ".mp4", ".webm"}
+SAMPLE_RATE = 16000  # both backends decode to 16 kHz mono
+MAX_DEFAULT_JOBS = 4  # every worker holds its own model copy (~1.5 GB for medium, ~3 GB for large), so ask for more explicitly
+
+_worker = {}  # per-process state, filled in by _init
+
+
+def collect(inputs, manifest=None):
+    """Expands files, directories, globs and an optional manifest into a sorted, de-duplicated list of paths"""
+    paths = []
+    if manifest:
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    paths.append(json.loads(line)["path"] if line.startswith("{") else line)
+    for item in inputs:
+        matches = glob.glob(item, recursive=True) if glob.has_magic(item) else [item]
+        for match in matches:
+            if os.path.isdir(match):
+                for root, _, files in os.walk(match):
+                    paths += [os.path.join(root, f) for f in files if os.path.splitext(f)[1].lower() in AUDIO_EXTENSIONS]
+            else:
+                paths.append(match)
+    return sorted(set(paths))
+
+
+def is_batch(inputs, manifest=None):
+    """True when the CLI inputs name more than one file, a directory, a glob or a manifest"""
+    return bool(manifest) or len(inputs) > 1 or any(os.path.isdir(i) or glob.has_magic(i) for i in inputs)
+
+
+def _init(module_name, model_size, threads, cache_dir=None):
+    """Worker initializer: imports the backend and loads the model once for the worker's lifetime"""
+    module = importlib.import_module(module_name)
+    cache = TranscriptCache(cache_dir) if cache_dir else None
+    if threads:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    module.load_model(model_size)
+    _worker.update(module=module, model_size=model_size, cache=cache)
+
+
+def _transcribe(path, language):
+    module = _worker["module"]
+    record = {"path": path, "worker": os.getpid()}
+    try:
+        start = time.perf_counter()
+        audio = module.load_audio(path)
+        decoded = time.perf_counter()
+        hits = cache.hits if (cache := _worker["cache"]) else 0
+        result = module.transcribe_audio(audio, _worker["model_size"], language, cache)
+        end = time.perf_counter()
+        record["cached"] = bool(cache) and cache.hits > hits
+        duration = audio.shape[0] / SAMPLE_RATE
+        record.update(text=result["text"], language=result.get("language"), duration=round(duration, 3),
+                      decode_seconds=round(decoded - start, 3), transcribe_seconds=round(end - decoded, 3),
+                      elapsed=round(end - start, 3), rtf=round((end - start) / duration, 4) if duration else None,
+                      segments=[{"start": s["start"], "end": s["end"], "text": s["text"]} for s in result.get("segments", [])])
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def default_jobs():
+    """Worker processes when none are asked for: one per CPU, at most MAX_DEFAULT_JOBS"""
+    return min(MAX_DEFAULT_JOBS, os.cpu_count() or 1)
+
+
+def run_batch(module_name, paths, model_size, language=None, jobs=None, output=None, cache_dir=None):
+    """
+    Transcribes many files in parallel
+
+    Args:
+        module_name: Backend module, 'transcribe_audio' or 'transcribe_audio_mlx'
+        paths: Audio files to transcribe
+        model_size: Whisper model size
+        language: Optional language code
+        jobs: Number of worker processes, each loads its own model (default: default_jobs())
+        output: JSONL file results are appended to (default: stdout)
+        cache_dir: Transcription cache directory shared by the workers, None to disable
+
+    Returns:
+        Summary dict with counts and totals
+    """
+    jobs = jobs or default_jobs()
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    out = open(output, "a") if output else sys.stdout
+    done = failed = 0
+    audio_seconds = 0.0
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(jobs, mp_context=get_context("spawn"), initializer=_init,
+                                 initargs=(module_name, model_size, threads, cache_dir)) as pool:
+            futures = [pool.submit(_transcribe, path, language) for path in paths]
+            for future in as_completed(futures):
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                done += 1
+                failed += "error" in record
+                audio_seconds += record.get("duration", 0)
+                print(f"[{done}/{len(paths)}] {record['path']} "
+                      + (f"ERROR {record['error']}" if "error" in record else f"rtf={record['rtf']}"), file=sys.stderr)
+    finally:
+        if output:
+            out.close()
+    wall = time.perf_counter() - start
+    return {"files": len(paths), "failed": failed, "audio_seconds": round(audio_seconds, 1),
+            "wall_seconds": round(wall, 1), "rtf": round(wall / audio_seconds, 4) if audio_seconds else None, "jobs": jobs}
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Transcription benchmark suite: real-time factor, latency, memory and load time per backend
+
+Backends:
+    whisper  openai-whisper through transcribe_audio.py
+    mlx      mlx-whisper through transcribe_audio_mlx.py (skipped when not installed)
+    stream   livewhisper's StreamHandler, fed the audio block by block as if from a microphone
+
+With --fast, every whisper and stream run is repeated in each fast CPU mode (fastmode.py), and
+the word error rate is reported against the fixture's reference transcript (a .txt next to it)
+or, without one, against the same run in fp32, so speedups come with their accuracy cost.
+
+Every (backend, model size, input) run happens in a fresh process, so model load time and peak
+RSS are not hidden by an earlier run. Inputs are synthetic signals and/or fixture files. Results
+are printed as a table and written as JSON, so runs from two releases can be diffed directly.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import re
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+from scipy.signal import resample_poly
+
+from fastmode import parse as parse_fast
+
+SAMPLE_RATE = 16000
+BACKENDS = ("whisper", "mlx", "stream")
+
+
+def load_input(path):
+    """Decodes a fixture to 16 kHz mono float32, WAVs without needing ffmpeg"""
+    if path.lower().endswith(".wav"):
+        from vad_bench import load_wav
+        rate, audio = load_wav(path)
+        return audio if rate == SAMPLE_RATE else resample_poly(audio, SAMPLE_RATE, rate).astype(np.float32)
+    import whisper
+    return whisper.load_audio(path)
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def _run_file_backend(module_name, audio, model_size, language):
+    from stream_ingest import transcribe_stream
+    from registry import registry
+    module = __import__(module_name)
+    start = time.perf_counter()
+    module.load_model(model_size)
+    load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = module.transcribe_audio(audio, model_size, language)
+    elapsed = time.perf_counter() - start
+
+    # time to first segment, through the windowed path a live caller would use
+    if module_name == "transcribe_audio":
+        transcribe = module.load_model(model_size).transcribe
+    else:
+        from functools import partial
+        import mlx_whisper
+        transcribe = partial(mlx_whisper.transcribe, path_or_hf_repo=module.MLX_REPO, verbose=False)
+    options = {"language": language} if language else {}
+    start = time.perf_counter()
+    first = None
+    for _ in transcribe_stream(transcribe, (audio[i:i + 5 * SAMPLE_RATE] for i in range(0, audio.shape[0], 5 * SAMPLE_RATE)), **options):
+        first = time.perf_counter() - start
+        break
+    return {"load_s": load, "elapsed_s": elapsed, "first_segment_s": first, "text": result["text"],
+            "models": registry.stats()["loaded"]}
+
+
+def _run_stream(audio, model_size, language, fast=None):
+    import livewhisper
+    livewhisper.Model, livewhisper.Lang, livewhisper.Fast = model_size, language, fast
+    texts, firsts = [], []
+
+    class Listener:
+        running, talking, partial = True, False, None
+        analyze = texts.append
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        handler = livewhisper.StreamHandler(Listener())
+        load = time.perf_counter() - start
+        device = resample_poly(audio, livewhisper.SampleRate, SAMPLE_RATE).astype(np.float32)[:, None]
+        # lets the endpointer close the last utterance; faint noise, not zeros, which the callback skips as a muted device
+        silence = (1e-4 * np.random.default_rng(0).standard_normal((int(livewhisper.SampleRate * 2), 1))).astype(np.float32)
+        device = np.concatenate((device, silence))
+        block = handler.blockframes
+        start = time.perf_counter()
+        for i in range(0, device.shape[0] - block + 1, block):
+            handler.callback(device[i:i + block], block, None, None)
+            while len(handler.queue):
+                handler.process(timeout=0)
+                firsts.append(time.perf_counter() - start)
+        elapsed = time.perf_counter() - start
+    return {"load_s": load, "elapsed_s": elapsed, "first_segment_s": firsts[0] if firsts else None,
+            "text": " ".join(texts), "utterances": len(texts), "handler": handler.stats()}
+
+
+def run_one(backend, audio, model_size, language=None, fast=None):
+    """Runs one benchmark in the current process, see run() for the isolated version"""
+    duration = audio.shape[0] / SAMPLE_RATE
+    if backend == "stream":
+        report = _run_stream(audio, model_size, language, fast)
+    else:
+        if fast:
+            os.environ["WHISPER_FAST"] = fast  # read by transcribe_audio.load_model()
+        report = _run_file_backend("transcribe_audio" if backend == "whisper" else "transcribe_audio_mlx", audio, model_size, language)
+    report.update(backend=backend, model=model_size, fast=fast, audio_s=round(duration, 2), rtf=report["elapsed_s"] / duration,
+                  peak_rss_mb=_peak_rss_mb())
+    return report
+
+
+def run(backend, audio, model_size, language=None, fast=None):
+    """Runs one benchmark in a fresh process"""
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(run_one, backend, audio, model_size, language, fast).result()
+
+
+def wer(reference, hypothesis):
+    """Word error rate, punctuation and case ignored"""
+    ref, hyp = (re.sub(r"[^\w\s']", " ", text.lower()).split() for text in (reference, hypothesis))
+    if not ref:
+        return float(bool(hyp))
+    row = np.arange(len(hyp) + 1)
+    for i, word in enumerate(ref, 1):
+        previous, row = row, np.empty_like(row)
+        row[0] = i
+        for j, other in enumerate(hyp, 1):
+            row[j] = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + (word != other))
+    return row[-1] / len(ref)
+
+
+def reference(path):
+    """The reference transcript stored next to a fixture, or None"""
+    try:
+        with open(os.path.splitext(path)[0] + ".txt") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def available(backend):
+    module = {"whisper": "whisper", "stream": "whisper", "mlx": "mlx_whisper"}[backend]
+    return importlib.util.find_spec(module) is not None
+
+
+def meta():
+    versions = {}
+    for package in ("numpy", "torch", "whisper", "mlx_whisper"):
+        try:
+            versions[package] = getattr(__import__(package), "__version__", "unknown")
+        except ImportError:
+            pass
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "platform": platform.platform(), "machine": platform.machine(), "cpus": os.cpu_count(), "versions": versions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transcription backends")
+    parser.add_argument("fixtures", nargs="*", help="Audio files to benchmark on")
+    parser.add_argument("-b", "--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS,
+                        help="Backends to run (default: all that are installed)")
+    parser.add_argument("-m", "--models", nargs="+", default=["tiny", "base"], help="Model sizes (default: tiny base)")
+    parser.add_argument("-l", "--language", help="Language code, detected otherwise")
+    parser.add_argument("--synthetic", type=float, nargs="*", default=[30.0], metavar="SECONDS",
+                        help="Lengths of generated speech-like inputs (default: 30)")
+    parser.add_argument("--fast", nargs="+", default=[], metavar="MODE",
+                        help="Also run in these fast CPU modes, e.g. int8 compile int8+compile (whisper and stream only)")
+    parser.add_argument("-o", "--output", help="Write the JSON results here (default: stdout)")
+
+    args = parser.parse_args()
+
+    from vad_bench import synthetic
+    inputs = [(f"synthetic-{s:g}s", synthetic(s)[1], None) for s in args.synthetic or []]
+    inputs += [(os.path.basename(path), load_input(path), reference(path)) for path in args.fixtures]
+    fasts = [None] + [parse_fast(mode) for mode in args.fast]
+    backends = [b for b in args.backends if available(b)]
+    skipped = sorted(set(args.backends) - set(backends))
+    if skipped:
+        print(f"Skipping, not installed: {', '.join(skipped)}", file=sys.stderr)
+
+    results = []
+    print(f"{'input':<22} {'backend':<8} {'model':<7} {'fast':<12} {'load s':>7} {'rtf':>7} {'first s':>8} {'rss MB':>8} {'wer':>6}",
+          file=sys.stderr)
+    for name, audio, truth in inputs:
+        for backend in backends:
+            for model in args.models:
+                baseline = None
+                for fast in fasts if backend != "mlx" else [None]:
+                    try:
+                        report = run(backend, audio, model, args.language, fast)
+                    except Exception as e:
+                        report = {"backend": backend, "model": model, "fast": fast, "error": f"{type(e).__name__}: {e}"}
+                    report["input"] = name
+                    results.append(report)
+                    label = f"{name[-22:]:<22} {backend:<8} {model:<7} {fast or 'fp32':<12}"
+                    if "error" in report:
+                        print(f"{label} ERROR {report['error']}", file=sys.stderr)
+                        continue
+                    if fast is None:
+                        baseline = report
+                    if truth is not None or (fast and baseline):
+                        report["wer"] = wer(truth if truth is not None else baseline["text"], report["text"])
+                        report["wer_against"] = "reference" if truth is not None else "fp32"
+                    if fast and baseline:
+                        report["speedup"] = baseline["elapsed_s"] / report["elapsed_s"]
+                    first = f"{report['first_segment_s']:8.2f}" if report["first_segment_s"] is not None else f"{'-':>8}"
+                    error_rate = f"{report['wer']:6.3f}" if "wer" in report else f"{'-':>6}"
+                    print(f"{label} {report['load_s']:7.2f} {report['rtf']:7.3f} {first} {report['peak_rss_mb']:8.0f} {error_rate}",
+                          file=sys.stderr)
+
+    document = json.dumps({"meta": meta(), "results": results}, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document)
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk cache of transcription results
+
+The key is a hash of the decoded audio plus everything that changes the output (backend,
+model, language, task), so re-running the pipeline over the same recordings skips Whisper
+even when files were renamed or re-encoded to identical audio. Entries are written to a temp
+file and renamed into place, which keeps concurrent batch workers from ever reading half a
+file. When the cache grows over its size limit, the least recently used entries are removed.
+Each process keeps a running byte total, so the directory is only scanned when that total goes
+over the limit, and eviction goes down to 90% of it so the next writes don't scan again.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+DEFAULT_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "call-center", "transcripts")
+
+
+def _jsonable(value):
+    return value.tolist() if hasattr(value, "tolist") else str(value)
+
+
+class TranscriptCache:
+    def __init__(self, directory=DEFAULT_DIR, max_mb=1024):
+        """
+        Args:
+            directory: Where entries are stored, shared safely between processes
+            max_mb: Size limit in MB, least recently used entries are evicted above it
+        """
+        self.directory = directory
+        self.max_bytes = max_mb * 2**20
+        self.size = None  # bytes in the cache as this process sees it, other writers are picked up by evict()'s scan
+        self.hits = self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(audio, model, language=None, task="transcribe"):
+        """Hash of the decoded 16 kHz audio and the settings that affect the transcription"""
+        digest = hashlib.sha256(np.ascontiguousarray(np.asarray(audio, dtype=np.float32)).tobytes())
+        digest.update(json.dumps([model, language, task]).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        """Returns the cached result dict, or None"""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            os.utime(path)  # mark as recently used for eviction
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(result, f, ensure_ascii=False, default=_jsonable)
+            written = os.path.getsize(tmp)
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if self.size is not None:
+            self.size += written - replaced
+        if self.size is None or self.size > self.max_bytes:  # the first write learns the size from a scan
+            self.evict()
+
+    def evict(self, fill=0.9):
+        """Scans the cache, and if it's over its size limit removes least recently used entries down to `fill` of it"""
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    if entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                except FileNotFoundError:
+                    pass  # evicted by another worker meanwhile
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * fill if total > self.max_bytes else self.max_bytes
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass  # another worker got there first
+            total -= size
+        self.size = total
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "directory": self.directory}
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Long-audio mode: split a recording at silences and transcribe the chunks in parallel
+
+A single model.transcribe() call decodes a long recording sequentially on one core. Here the
+audio is cut into chunks of bounded length, preferably in the middle of the longest pause
+(found with the energy VAD from vad.py), and the chunks are spread over worker processes. When
+no pause exists, the cut is made at the quietest point and neighbouring chunks overlap. Every
+chunk owns the span between its cuts, segments are kept by the chunk that owns their midpoint.
+"""
+
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+import batch
+from vad import make_vad, frame
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+
+
+def _longest_run(mask):
+    """Returns (start, end) of the longest run of True in a bool array, or None"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    if not len(edges):
+        return None
+    starts, ends = edges[::2], edges[1::2]
+    i = np.argmax(ends - starts)
+    return starts[i], ends[i]
+
+
+def plan_chunks(audio, max_seconds=120.0, overlap=1.0):
+    """
+    Picks the cut points for a long recording
+
+    Args:
+        audio: 16 kHz mono float32 audio
+        max_seconds: Longest chunk, cuts are searched in the second half of this window
+        overlap: Seconds shared by neighbouring chunks when a cut has to go through speech
+
+    Returns:
+        List of chunks as dicts with 'start'/'end' (samples to decode) and 'own' (samples it owns)
+    """
+    framelen = SAMPLE_RATE * FRAME_MS // 1000
+    frames = frame(audio, framelen)
+    vad = make_vad("energy", SAMPLE_RATE)
+    speech = np.concatenate([vad(frames[i:i + 100]) for i in range(0, len(frames), 100)]) if len(frames) else np.zeros(0, bool)
+    loudness = np.convolve(vad.rms(frames), np.ones(10) / 10, "same") if len(frames) else speech
+    longest = int(max_seconds * 1000 / FRAME_MS)
+
+    cuts, pos = [(0, False)], 0
+    while len(frames) - pos > longest:
+        lo, hi = pos + longest // 2, pos + longest
+        run = _longest_run(~speech[lo:hi])
+        if run is not None:
+            cut, forced = lo + (run[0] + run[1]) // 2, False
+        else:
+            cut, forced = lo + int(np.argmin(loudness[lo:hi])), True
+        cuts.append((cut, forced))
+        pos = cut
+
+    pad = int(overlap * SAMPLE_RATE)
+    bounds = [int(cut) * framelen for cut, _ in cuts] + [audio.shape[0]]
+    chunks = []
+    for i, (_, forced) in enumerate(cuts):
+        start, end = bounds[i], bounds[i + 1]
+        chunks.append({"start": max(0, start - pad) if forced else start,
+                       "end": min(audio.shape[0], end + pad) if i + 1 < len(cuts) and cuts[i + 1][1] else end,
+                       "own": (start, end)})
+    return chunks
+
+
+def _transcribe_chunk(audio, language):
+    module = batch._worker["module"]
+    start = time.perf_counter()
+    result = module.transcribe_audio(audio, batch._worker["model_size"], language, batch._worker["cache"])
+    return result, time.perf_counter() - start
+
+
+def stitch(chunks, results):
+    """Joins per-chunk results into one, shifting timestamps and keeping each segment in the chunk that owns it"""
+    segments = []
+    for chunk, result in zip(chunks, results):
+        offset = chunk["start"] / SAMPLE_RATE
+        own_start, own_end = chunk["own"][0] / SAMPLE_RATE, chunk["own"][1] / SAMPLE_RATE
+        for segment in result["segments"]:
+            start, end = segment["start"] + offset, segment["end"] + offset
+            if not own_start <= (start + end) / 2 < own_end:
+                continue  # decoded in the overlap, the neighbouring chunk owns it
+            segment = dict(segment, id=len(segments), start=start, end=end)
+            if "words" in segment:
+                segment["words"] = [dict(w, start=w["start"] + offset, end=w["end"] + offset) for w in segment["words"]]
+            segments.append(segment)
+    languages = Counter(r.get("language") for r in results if r.get("language"))
+    return {"text": "".join(s["text"] for s in segments), "segments": segments,
+            "language": languages.most_common(1)[0][0] if languages else None}
+
+
+def transcribe_long(module_name, audio, model_size="base", language=None, jobs=None, max_seconds=120.0, overlap=1.0,
+                    cache_dir=None):
+    """
+    Transcribes a long recording in parallel chunks
+
+    Args:
+        module_name: Backend module, 'transcribe_audio' or 'transcribe_audio_mlx'
+        audio: 16 kHz mono float32 audio
+        model_size: Whisper model size
+        language: Optional language code, detected per chunk otherwise
+        jobs: Number of worker processes, each loads its own model (default: batch.default_jobs(), capped at the number of chunks)
+        max_seconds: Longest chunk in seconds
+        overlap: Seconds of overlap around cuts that go through speech
+        cache_dir: Transcription cache directory, chunks are cached individually, None to disable
+
+    Returns:
+        Stitched transcription result, with a 'chunks' list of per-chunk spans and timings
+    """
+    chunks = plan_chunks(audio, max_seconds, overlap)
+    jobs = min(jobs or batch.default_jobs(), len(chunks))
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    with ProcessPoolExecutor(jobs, mp_context=get_context("spawn"), initializer=batch._init,
+                             initargs=(module_name, model_size, threads, cache_dir)) as pool:
+        futures = [pool.submit(_transcribe_chunk, audio[c["start"]:c["end"]], language) for c in chunks]
+        done = [future.result() for future in futures]
+    result = stitch(chunks, [r for r, _ in done])
+    result["chunks"] = [{"start": c["start"] / SAMPLE_RATE, "end": c["end"] / SAMPLE_RATE, "seconds": round(s, 2)}
+                        for c, (_, s) in zip(chunks, done)]
+    return result
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+from collections import deque
+import numpy as np
+
+# Adaptive endpointing for livewhisper: how many blocks of silence end an utterance.
+# A fixed hang-over (EndBlocks) makes every turn wait the worst case. Here the wait is picked per
+# block from what we know about the caller:
+#  - recent pause statistics: a caller who pauses 400 ms mid-sentence needs more than that
+#  - utterance length: short answers ("yes", "no, thanks") rarely continue after a pause
+#  - trailing energy slope: speech fading out ends a sentence, an abrupt stop is often a breath
+# The delay chosen for each utterance is kept so the trade-off against cutting callers off can be tuned.
+
+class AdaptiveEndpointer:
+    def __init__(self, minblocks=10, maxblocks=40, blockms=30, history=50):
+        self.minblocks, self.maxblocks, self.blockms = minblocks, maxblocks, blockms
+        self.pauses = deque(maxlen=history)  # lengths (blocks) of pauses the caller resumed after
+        self.delays = deque(maxlen=history)  # chosen endpoint delay (ms) per finished utterance
+        self.energy = deque(maxlen=8)        # dB of the latest speech blocks, for the trailing slope
+        self.start()
+
+    def start(self):
+        """Resets the per-utterance state, pause history is kept across utterances."""
+        self.speechblocks = self.silence = 0
+        self.energy.clear()
+
+    def slope(self) -> float:
+        """dB per block over the end of the speech, negative when the voice was fading out."""
+        if len(self.energy) < 3: return 0.0
+        return float(np.polyfit(np.arange(len(self.energy)), np.array(self.energy), 1)[0])
+
+    def hangover(self) -> int:
+        if self.minblocks >= self.maxblocks: return self.maxblocks
+        if len(self.pauses) >= 3: blocks = 1.25 * np.percentile(self.pauses, 90) + 2
+        else: blocks = (self.minblocks + self.maxblocks) / 2
+        if self.speechblocks * self.blockms < 1000: blocks *= 0.75  # short answer
+        slope = self.slope()
+        if slope < -1: blocks *= 0.8    # trailing off, sentence is likely done
+        elif slope > 0.5: blocks *= 1.25 # cut off mid-word
+        return int(np.clip(round(blocks), self.minblocks, self.maxblocks))
+
+    def update(self, speech: bool, rms: float) -> bool:
+        """Feeds one block of the current utterance, returns True once the utterance has ended."""
+        if speech:
+            if self.silence and self.speechblocks: self.pauses.append(self.silence)
+            self.silence = 0
+            self.speechblocks += 1
+            self.energy.append(20 * np.log10(rms + 1e-9))
+            return False
+        self.silence += 1
+        if self.silence < (hangover := self.hangover()): return False
+        self.delays.append(hangover * self.blockms)
+        return True
+
+    def stats(self) -> dict:
+        delays = list(self.delays)
+        return {'last_ms': delays[-1] if delays else None,
+                'mean_ms': float(np.mean(delays)) if delays else None,
+                'p90_ms': float(np.percentile(delays, 90)) if delays else None,
+                'pause_p90_ms': float(np.percentile(self.pauses, 90)) * self.blockms if self.pauses else None}
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Opt-in fast CPU inference for openai-whisper models
+
+Modes, combined with '+' (e.g. 'int8+compile'):
+    int8     dynamic int8 quantization of every Linear layer, encoder and decoder
+    compile  torch.compile of the encoder, the decoder's KV-cache hooks and changing
+             shapes make it recompile per step, so it stays eager
+
+Compiled kernels are written to a persistent inductor cache, so only the first start on a
+machine pays for compilation. The model gets a short warm-up pass after loading, so the first
+real utterance doesn't pay for lazy initialization either. The mode is picked per model through
+the registry's dtype key, or for a whole process (including spawned batch workers) through the
+WHISPER_FAST environment variable. benchmark.py --fast reports speed and WER against fp32.
+"""
+
+import os
+
+import numpy as np
+
+MODES = ("int8", "compile")
+ENV = "WHISPER_FAST"
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "call-center", "inductor")
+
+
+def mode():
+    """The process-wide fast mode from WHISPER_FAST, None when not set"""
+    return parse(os.environ.get(ENV)) or None
+
+
+def parse(value):
+    """Normalizes a mode string like 'compile+int8' to 'int8+compile', raises ValueError on unknown parts"""
+    parts = {p.strip() for p in (value or "").split("+") if p.strip()}
+    if unknown := parts - set(MODES):
+        raise ValueError(f"Unknown fast mode {', '.join(sorted(unknown))}, use {' and/or '.join(MODES)}")
+    return "+".join(m for m in MODES if m in parts)
+
+
+def quantize(model):
+    """Dynamic int8 quantization of the Linear layers, weights int8, activations quantized per batch"""
+    import torch
+    import whisper.model
+
+    # quantize_dynamic matches module types exactly, and whisper's Linear is a subclass that
+    # casts its weights to the input dtype, which is a no-op in fp32
+    for module in list(model.modules()):
+        for name, child in module.named_children():
+            if type(child) is whisper.model.Linear:
+                linear = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+                linear.load_state_dict(child.state_dict())
+                setattr(module, name, linear)
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def compile_encoder(model, cache_dir=CACHE_DIR):
+    import torch
+
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", cache_dir)
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    model.encoder = torch.compile(model.encoder)  # input is always the padded 30 s mel, one shape per batch size
+    return model
+
+
+def warmup(model):
+    """Runs the encoder and a few decoder steps once, which triggers compilation and lazy initialization"""
+    import whisper
+
+    mel = whisper.log_mel_spectrogram(np.zeros(whisper.audio.N_SAMPLES, np.float32), model.dims.n_mels)
+    model.decode(mel[None].to(model.device), whisper.DecodingOptions(fp16=False, language="en", sample_len=4))
+
+
+def optimize(model, fast):
+    """Applies a fast mode to a loaded openai-whisper model, returns the model to use"""
+    fast = parse(fast)
+    if not fast:
+        return model
+    model = model.cpu().eval()  # quantized kernels are CPU only
+    if "int8" in fast:
+        model = quantize(model)
+    if "compile" in fast:
+        model = compile_encoder(model)
+    warmup(model)
+    return model
@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
-import whisper, os
+import threading
 import numpy as np
-import sounddevice as sd
-from scipy.io.wavfile import write
+from collections import deque
+from time import monotonic
+from ringbuffer import RingBuffer
+from resample import StreamResampler, WhisperRate
+from utterances import UtteranceQueue
+from vad import make_vad
+from endpoint import AdaptiveEndpointer
+from streaming import StreamingDecoder
+from registry import get_model
 
 # This is my attempt to make psuedo-live transcription of speech using Whisper.
 # Since my system can't use pyaudio, I'm using sounddevice instead.
@@ -16,21 +23,45 @@ SampleRate = 44100  # Stream device recording frequency
 BlockSize = 30      # Block size in milliseconds
 Threshold = 0.01     # Minimum volume threshold to activate listening
 Vocals = [50, 1000] # Frequency range to detect sounds that could be speech
-EndBlocks = 40      # Number of blocks to wait before sending to Whisper
+VadEngine = 'dominant' # Speech detector: 'dominant', 'energy', 'band' or 'zcr' (see vad.py)
+EndBlocks = 40      # Number of blocks to wait before sending to Whisper (the most, when AdaptiveEnd)
+MinEndBlocks = 10   # Fewest blocks of silence that can end an utterance
+AdaptiveEnd = True  # Pick the wait per utterance from pauses, length & trailing energy (see endpoint.py)
+MaxSeconds = 60     # Longest utterance held in the ring buffer before it's sent to Whisper anyway
+QueueSize = 4       # Utterances allowed to wait for Whisper before backpressure kicks in
+Backpressure = 'drop_oldest' # What to do when the queue is full: 'drop_oldest' or 'merge'
+Streaming = False   # Emit partial transcripts while the caller is still talking (see streaming.py)
+PartialMs = 500     # How often the in-progress utterance is re-decoded when Streaming
+WindowSeconds = 15  # Longest audio window re-decoded per partial
+Fast = None         # Faster CPU inference: 'int8', 'compile' or 'int8+compile' (see fastmode.py)
 
 class StreamHandler:
-    def __init__(self, assist=None):
+    def __init__(self, assist=None, vad=VadEngine, streaming=Streaming):
         if assist == None:  # If not being run by my assistant, just run as terminal transcriber.
-            class fakeAsst(): running, talking, analyze = True, False, None
+            class fakeAsst(): running, talking, analyze, partial = True, False, None, None
             self.asst = fakeAsst()  # anyone know a better way to do this?
         else: self.asst = assist
         self.running = True
-        self.padding = 0
-        self.prevblock = self.buffer = np.zeros((0,1))
-        self.fileready = False
+        self.blockframes = int(SampleRate * BlockSize / 1000)
+        self.resampler = StreamResampler(SampleRate, WhisperRate) # audio is kept at Whisper's 16 kHz from the start
+        self.ring = RingBuffer(int(WhisperRate * (MaxSeconds + BlockSize / 1000))) # owns pre-roll, speech & padding
+        self.queue = UtteranceQueue(QueueSize, Backpressure, on_drop=self.dropped) # finished utterances waiting for Whisper, 16 kHz float32
+        self.vad = make_vad(vad, SampleRate, threshold=Threshold, vocals=Vocals)
+        self.endpointer = AdaptiveEndpointer(MinEndBlocks if AdaptiveEnd else EndBlocks, EndBlocks, BlockSize)
+        self.done = threading.Event()
+        self.lock = threading.Lock() # the worker copies in-progress audio out of the ring for partials
+        self.uttid, self.began = 0, 0.0
+        self.firstword = deque(maxlen=50) # seconds from speech start to the first committed partial word
         print("\033[96mLoading Whisper Model..\033[0m", end='', flush=True)
-        self.model = whisper.load_model(f'{Model}')
+        self.model = get_model('whisper', Model, dtype=Fast) # shared with anything else in the process using the same model
         print("\033[90m Done.\033[0m")
+        self.streamer = StreamingDecoder(self.model, WindowSeconds, fp16=False, language=Lang,
+                                         task='translate' if Translate else 'transcribe') if streaming else None
+
+    def begin(self, preroll=0):
+        self.ring.begin(preroll)
+        self.uttid += 1
+        self.began = monotonic()
 
     def callback(self, indata, frames, time, status):
         #if status: print(status) # for debugging, prints stream errors.
@@ -39,49 +70,91 @@ class StreamHandler:
             #print("\033[31mNo input or device is muted.\033[0m") #old way
             #self.running = False  # used to terminate if no input
             return
-        # A few alternative methods exist for detecting speech.. #indata.max() > Threshold
-        #zero_crossing_rate = np.sum(np.abs(np.diff(np.sign(indata)))) / (2 * indata.shape[0]) # threshold 20
-        freq = np.argmax(np.abs(np.fft.rfft(indata[:, 0]))) * SampleRate / frames
-        if np.sqrt(np.mean(indata**2)) > Threshold and Vocals[0] <= freq <= Vocals[1] and not self.asst.talking:
-            print('.', end='', flush=True)
-            if self.padding < 1: self.buffer = self.prevblock.copy()
-            self.buffer = np.concatenate((self.buffer, indata))
-            self.padding = EndBlocks
-        else:
-            self.padding -= 1
-            if self.padding > 1:
-                self.buffer = np.concatenate((self.buffer, indata))
-            elif self.padding < 1 < self.buffer.shape[0] > SampleRate: # if enough silence has passed, write to file.
-                self.fileready = True
-                write('dictate.wav', SampleRate, self.buffer) # I'd rather send data to Whisper directly..
-                self.buffer = np.zeros((0,1))
-            elif self.padding < 1 < self.buffer.shape[0] < SampleRate: # if recording not long enough, reset buffer.
-                self.buffer = np.zeros((0,1))
-                print("\033[2K\033[0G", end='', flush=True)
-            else:
-                self.prevblock = indata.copy() #np.concatenate((self.prevblock[-int(SampleRate/10):], indata)) # SLOW
+        speech = self.vad(indata[:, 0])[0] and not self.asst.talking # a few methods exist for detecting speech, see vad.py
+        with self.lock:
+            if speech:
+                print('.', end='', flush=True)
+                if not self.ring.recording:
+                    self.begin(preroll=int(WhisperRate * BlockSize / 1000)) # previous block becomes pre-roll
+                    self.endpointer.start()
+            self.ring.append(self.resampler(indata[:, 0])[:, None]) # always written, so the pre-roll is there when speech starts
+            if not self.ring.recording: return
+            ended = self.endpointer.update(speech, float(np.sqrt(np.mean(indata**2))))
+            if ended or self.ring.full:
+                if len(self.ring) > WhisperRate: # if enough silence has passed, hand the audio to Whisper.
+                    delay = self.endpointer.delays[-1] if ended else 0
+                    self.queue.put(self.ring.view()[:, 0].copy(), endpoint_ms=delay, uid=self.uttid) # the view gets overwritten, Whisper needs its own copy
+                else:
+                    print("\033[2K\033[0G", end='', flush=True) # if recording not long enough, reset buffer.
+                    self.dropped({'uid': self.uttid}) # its partials never get a final pass
+                self.ring.reset()
+                if not ended: self.begin() # hit MaxSeconds mid-speech, keep recording
+
+    def dropped(self, info):
+        """An utterance that won't get a final pass, frees the streamer if its partials belong to it."""
+        if self.streamer and self.streamer.uid == info.get('uid'): self.streamer.reset()
+
+    def process(self, timeout=None):
+        if self.streamer: timeout = PartialMs / 1000 # wake up for partials while the caller is talking
+        if not (utterance := self.queue.get(timeout)): # blocks while idle instead of spinning
+            if self.streamer: self.partial()
+            return
+        print(f"\n\033[90mTranscribing.. ({utterance.info.get('endpoint_ms', 0)} ms endpoint)\033[0m")
+        current = self.streamer and self.streamer.uid == utterance.info.get('uid') # the partials belong to this utterance
+        if current and not utterance.merges:
+            text = self.streamer.finish(utterance.audio) # only the tail after the committed words is new
+        else: # merged audio doesn't line up with the streamer's window any more
+            text = self.model.transcribe(utterance.audio,fp16=False,language=Lang,task='translate' if Translate else 'transcribe')['text']
+        if current: self.streamer.reset() # an older utterance's final keeps the partials of the one still being spoken
+        print(f"\033[1A\033[2K\033[0G{text}")
+        if self.asst.analyze != None: self.asst.analyze(text)
 
-    def process(self):
-        if self.fileready:
-            print("\n\033[90mTranscribing..\033[0m")
-            result = self.model.transcribe('dictate.wav',fp16=False,language=Lang,task='translate' if Translate else 'transcribe')
-            print(f"\033[1A\033[2K\033[0G{result['text']}")
-            if self.asst.analyze != None: self.asst.analyze(result['text'])
-            self.fileready = False
+    def partial(self):
+        with self.lock:
+            if not self.ring.recording or len(self.ring) < WhisperRate // 2: return
+            if self.streamer.uid not in (None, self.uttid): return # last utterance's final pass is still queued
+            if len(self.ring) - self.streamer.decoded < WhisperRate * PartialMs / 2000: return # not enough new audio
+            uid, began, audio = self.uttid, self.began, self.ring.view()[:, 0].copy()
+        if self.streamer.uid is None: self.streamer.reset(uid)
+        if new := self.streamer.step(audio):
+            if len(new) == len(self.streamer.agreement.committed): self.firstword.append(monotonic() - began)
+            text = self.streamer.agreement.text()
+            print(f"\033[2K\033[0G\033[90m{text}\033[0m", end='', flush=True)
+            if getattr(self.asst, 'partial', None) != None: self.asst.partial(text)
+
+    def worker(self):
+        try:
+            while self.running and self.asst.running and not self.queue.closed: self.process()
+        finally: self.done.set()
 
     def listen(self):
+        import sounddevice as sd # needs PortAudio, only imported when a live stream is opened
         print("\033[32mListening.. \033[37m(Ctrl+C to Quit)\033[0m")
-        with sd.InputStream(channels=1, callback=self.callback, blocksize=int(SampleRate * BlockSize / 1000), samplerate=SampleRate):
-            while self.running and self.asst.running: self.process()
+        transcriber = threading.Thread(target=self.worker, name='transcriber', daemon=True)
+        try:
+            with sd.InputStream(channels=1, callback=self.callback, blocksize=self.blockframes, samplerate=SampleRate, dtype='float32'):
+                transcriber.start()
+                self.done.wait() # set by the worker once the assistant stops running, or by stop()
+        finally: self.queue.close()
+
+    def stop(self):
+        self.running = False
+        self.queue.close() # wakes the worker if it's idle
+
+    def stats(self) -> dict:
+        stats = {'queue': self.queue.stats(), 'endpoint': self.endpointer.stats()}
+        if self.firstword: stats['first_word_s'] = float(np.mean(self.firstword))
+        return stats
 
 def main():
+    handler = None
     try:
         handler = StreamHandler()
         handler.listen()
     except (KeyboardInterrupt, SystemExit): pass
     finally:
         print("\n\033[93mQuitting..\033[0m")
-        if os.path.exists('dictate.wav'): os.remove('dictate.wav')
+        if handler: print(f"\033[90m{handler.stats()}\033[0m")
 
 if __name__ == '__main__':
     main()  # by Nik
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+import argparse, json, os, socket, threading, time
+from collections import deque
+import numpy as np
+from ringbuffer import RingBuffer
+from resample import StreamResampler, WhisperRate
+from utterances import UtteranceQueue
+from vad import make_vad
+from endpoint import AdaptiveEndpointer
+from registry import get_model
+from fastmode import mode as fast_mode
+
+# Multi-call ingest for livewhisper: many concurrent lines, one shared Whisper model.
+# StreamHandler serves a single InputStream and runs one model.transcribe() per utterance. Here every
+# line (sound device, local socket connection or WAV replay) gets its own resampler, ring buffer, VAD
+# and endpointer, and finished utterances from all lines go into one queue. The decoder takes whatever
+# is ready, waits at most MaxWaitMs for more, and runs them through the encoder and decoder as one
+# batch: the padded 30 s mel windows are stacked, so 8 utterances cost far less than 8 passes.
+# Utterances longer than Whisper's 30 s window go through model.transcribe() on their own.
+#   python multicall.py calls/*.wav --repeat 4          # replay files as simultaneous calls
+#   python multicall.py --socket /tmp/calls.sock        # clients send a JSON header line, then s16le PCM
+
+Model = 'base'      # Whisper model size shared by all lines
+Lang = None         # Language code, detected per utterance when None
+BlockSize = 30      # Block size in milliseconds
+Threshold = 0.01    # Minimum volume threshold to activate listening
+Vocals = [50, 1000] # Frequency range to detect sounds that could be speech
+VadEngine = 'dominant'
+EndBlocks = 40      # Most blocks of silence before an utterance ends
+MinEndBlocks = 10   # Fewest blocks of silence that can end an utterance
+MaxSeconds = 30     # Longest utterance, at Whisper's window so everything can be batched
+MaxBatch = 8        # Utterances decoded in one forward pass
+MaxWaitMs = 200     # Longest an utterance waits for others to fill the batch
+QueueSize = 64      # Utterances waiting for the decoder, across all lines
+
+class Line:
+    """Per-call state: what StreamHandler.callback() keeps, for one of many lines."""
+    def __init__(self, name, samplerate, queue, vad=VadEngine):
+        self.name, self.samplerate, self.queue = name, samplerate, queue
+        self.blockframes = int(samplerate * BlockSize / 1000)
+        self.resampler = StreamResampler(samplerate, WhisperRate)
+        self.ring = RingBuffer(int(WhisperRate * (MaxSeconds + BlockSize / 1000)))
+        self.vad = make_vad(vad, samplerate, threshold=Threshold, vocals=Vocals)
+        self.endpointer = AdaptiveEndpointer(MinEndBlocks, EndBlocks, BlockSize)
+        self.pending = np.zeros(0, np.float32) # sources don't always deliver whole blocks
+        self.fed = 0.0 # seconds of audio ingested
+        self.utterances = 0
+
+    def feed(self, audio):
+        """Takes mono float32 audio of any length, at the line's sample rate."""
+        audio = np.concatenate((self.pending, audio)) if self.pending.shape[0] else audio
+        whole = audio.shape[0] - audio.shape[0] % self.blockframes
+        for i in range(0, whole, self.blockframes): self.block(audio[i:i + self.blockframes])
+        self.pending = audio[whole:].copy()
+        self.fed += whole / self.samplerate
+
+    def block(self, block):
+        speech = bool(self.vad(block)[0])
+        if speech and not self.ring.recording:
+            self.ring.begin(preroll=int(WhisperRate * BlockSize / 1000))
+            self.endpointer.start()
+        self.ring.append(self.resampler(block)[:, None])
+        if not self.ring.recording: return
+        ended = self.endpointer.update(speech, float(np.sqrt(np.mean(block**2))))
+        if ended or self.ring.full: self.flush(ended)
+
+    def flush(self, ended=True):
+        if len(self.ring) > WhisperRate:
+            self.utterances += 1
+            self.queue.put(self.ring.view()[:, 0].copy(), line=self.name, ready=time.monotonic())
+        self.ring.reset()
+        if not ended: self.ring.begin() # hit MaxSeconds mid-speech, keep recording
+
+    def close(self):
+        if self.ring.recording: self.flush()
+
+class BatchDecoder:
+    def __init__(self, model, maxbatch=MaxBatch, maxwait=MaxWaitMs, history=1000, **options):
+        import whisper
+        self.whisper, self.model = whisper, model
+        self.maxbatch, self.maxwait = maxbatch, maxwait / 1000
+        self.options = dict(fp16=False, language=Lang, without_timestamps=True) | options
+        self.batches = deque(maxlen=history)  # batch sizes
+        self.waits = deque(maxlen=history)    # seconds from an utterance being ready to its batch starting
+        self.added = deque(maxlen=history)    # part of that spent only waiting for the batch to fill
+        self.collected = 0.0
+        self.decodes = deque(maxlen=history)  # seconds per batch forward pass
+        self.busy = 0.0
+
+    def collect(self, queue):
+        """Blocks for one utterance, then gathers more until the batch is full or MaxWaitMs has passed."""
+        if not (first := queue.get()): return []
+        self.collected = time.monotonic() # anything ready before this was held up by the backlog, not by batching
+        batch, deadline = [first], self.collected + self.maxwait
+        while len(batch) < self.maxbatch and (left := deadline - time.monotonic()) > 0:
+            if not (item := queue.get(left)): break
+            batch.append(item)
+        return batch
+
+    def decode(self, utterances):
+        """Returns the text of every utterance, in order."""
+        start = time.monotonic()
+        self.waits.extend(start - u.info['ready'] for u in utterances)
+        self.added.extend(start - max(u.info['ready'], self.collected) for u in utterances)
+        short = [i for i, u in enumerate(utterances) if u.audio.shape[0] <= self.whisper.audio.N_SAMPLES]
+        texts = [None] * len(utterances)
+        if short:
+            mel = np.stack([self.whisper.log_mel_spectrogram(self.whisper.pad_or_trim(utterances[i].audio), self.model.dims.n_mels).numpy()
+                            for i in short])
+            import torch
+            results = self.model.decode(torch.from_numpy(mel).to(self.model.device), self.whisper.DecodingOptions(**self.options))
+            for i, result in zip(short, results): texts[i] = result.text
+        for i in set(range(len(utterances))) - set(short): # over 30 s, e.g. a line merged by backpressure
+            texts[i] = self.model.transcribe(utterances[i].audio, fp16=False, language=self.options['language'])['text']
+        elapsed = time.monotonic() - start
+        self.batches.append(len(utterances))
+        self.decodes.append(elapsed)
+        self.busy += elapsed
+        return texts
+
+    def stats(self) -> dict:
+        waits, added, decodes = list(self.waits), list(self.added), list(self.decodes)
+        return {'batches': len(self.batches), 'batch_mean': float(np.mean(self.batches)) if self.batches else 0.0,
+                'wait_mean_ms': 1000 * float(np.mean(waits)) if waits else 0.0,
+                'batching_added_mean_ms': 1000 * float(np.mean(added)) if added else 0.0,
+                'batching_added_p95_ms': 1000 * float(np.percentile(added, 95)) if added else 0.0,
+                'decode_mean_ms': 1000 * float(np.mean(decodes)) if decodes else 0.0, 'busy_s': self.busy}
+
+class CallCenter:
+    def __init__(self, model=Model, maxbatch=MaxBatch, maxwait=MaxWaitMs, vad=VadEngine, output=print):
+        self.queue = UtteranceQueue(QueueSize, 'drop_oldest')
+        self.lines, self.threads, self.vad, self.output = {}, [], vad, output
+        self.lock = threading.Lock()
+        self.decoder = BatchDecoder(get_model('whisper', model, dtype=fast_mode()), maxbatch, maxwait)
+        self.started, self.cpu = time.monotonic(), time.process_time()
+
+    def line(self, name, samplerate) -> Line:
+        with self.lock:
+            if name in self.lines: name = f"{name}#{len(self.lines)}"
+            self.lines[name] = line = Line(name, samplerate, self.queue, self.vad)
+        return line
+
+    def source(self, target, *args):
+        """Runs a source in its own thread, see wav_source(), device_source() and socket_source()."""
+        thread = threading.Thread(target=target, args=(self, *args), daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def run(self):
+        """Decodes until every source has finished (runs forever with a socket or device source)."""
+        threading.Thread(target=self.closer, daemon=True).start()
+        while batch := self.decoder.collect(self.queue):
+            for utterance, text in zip(batch, self.decoder.decode(batch)):
+                self.output(f"[{utterance.info['line']}] {text.strip()}")
+
+    def closer(self):
+        for thread in self.threads: thread.join()
+        self.queue.close() # get() drains what's queued, then returns None
+
+    def stats(self) -> dict:
+        wall, cpu = time.monotonic() - self.started, time.process_time() - self.cpu
+        audio = sum(line.fed for line in self.lines.values())
+        # every call produces one second of audio per second, so audio per CPU second is calls per core
+        return {'lines': len(self.lines), 'audio_s': audio, 'wall_s': wall, 'cpu_s': cpu,
+                'utterances': sum(line.utterances for line in self.lines.values()),
+                'calls_per_core': audio / cpu if cpu else 0.0, 'realtime_factor': audio / wall if wall else 0.0,
+                'decoder': self.decoder.stats(), 'queue': self.queue.stats()}
+
+def wav_source(center, path, realtime=True, name=None):
+    """Replays a WAV file as one call, at real-time pace unless realtime=False."""
+    from vad_bench import load_wav
+    rate, audio = load_wav(path)
+    line = center.line(name or os.path.basename(path), rate)
+    step, start = line.blockframes * 10, time.monotonic()
+    for i in range(0, audio.shape[0], step):
+        line.feed(audio[i:i + step])
+        if realtime: time.sleep(max(0.0, start + (i + step) / rate - time.monotonic()))
+    line.feed(np.zeros(int(rate * EndBlocks * BlockSize / 1000), np.float32)) # trailing silence ends the last utterance
+    line.close()
+
+def device_source(center, device=None, samplerate=None):
+    import sounddevice as sd # needs PortAudio, only imported when a device is opened
+    samplerate = int(samplerate or sd.query_devices(device, 'input')['default_samplerate'])
+    line = center.line(f"device-{device}", samplerate)
+    with sd.InputStream(device=device, channels=1, samplerate=samplerate, blocksize=line.blockframes, dtype='float32',
+                        callback=lambda indata, frames, time, status: line.feed(indata[:, 0].copy())):
+        threading.Event().wait()
+
+def socket_source(center, path):
+    """Accepts calls on a Unix socket. Each connection is one call: a JSON header line such as
+    {"call": "line-7", "rate": 8000}, then mono s16le PCM until the caller hangs up."""
+    if os.path.exists(path): os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    while True:
+        conn, _ = server.accept()
+        threading.Thread(target=_serve, args=(center, conn), daemon=True).start()
+
+def _serve(center, conn):
+    with conn, conn.makefile('rb') as f:
+        header = json.loads(f.readline())
+        line = center.line(str(header.get('call', 'socket')), int(header.get('rate', WhisperRate)))
+        while data := f.read(line.blockframes * 2 * 10):
+            line.feed(np.frombuffer(data[:len(data) // 2 * 2], np.int16).astype(np.float32) / 32768.0)
+        line.close()
+
+def main():
+    global Lang
+    parser = argparse.ArgumentParser(description="Transcribe many simultaneous calls with one batched Whisper model")
+    parser.add_argument("wavs", nargs="*", help="WAV files replayed as simultaneous calls")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay every file this many times at once")
+    parser.add_argument("--no-realtime", action="store_true", help="Replay as fast as possible instead of in real time")
+    parser.add_argument("--socket", help="Also accept calls on this Unix socket")
+    parser.add_argument("--device", action="append", default=[], help="Also listen on this sound device (repeatable)")
+    parser.add_argument("-m", "--model", default=Model, help=f"Whisper model size (default: {Model})")
+    parser.add_argument("-l", "--language", help="Language code, detected per utterance otherwise")
+    parser.add_argument("--batch", type=int, default=MaxBatch, help=f"Utterances per forward pass, 1 disables batching (default: {MaxBatch})")
+    parser.add_argument("--wait-ms", type=float, default=MaxWaitMs, help=f"Longest wait for a batch to fill (default: {MaxWaitMs})")
+    parser.add_argument("--vad", default=VadEngine, help=f"Speech detector (default: {VadEngine})")
+    args = parser.parse_args()
+    Lang = args.language
+
+    center = CallCenter(args.model, args.batch, args.wait_ms, args.vad)
+    for path in args.wavs:
+        for i in range(args.repeat):
+            center.source(wav_source, path, not args.no_realtime, f"{os.path.basename(path)}-{i}")
+    for device in args.device: center.source(device_source, int(device) if device.isdigit() else device)
+    if args.socket: center.source(socket_source, args.socket)
+    try: center.run()
+    except KeyboardInterrupt: pass
+    finally: print(json.dumps(center.stats(), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Process-wide registry of loaded Whisper models
+
+Models are loaded lazily on first use, shared by every caller in the process and kept in LRU
+order. When the estimated size of the loaded models goes over the memory budget, the least
+recently used ones are dropped. Backends are imported only when a model of theirs is loaded,
+so the registry can be used where only one of openai-whisper / mlx-whisper is installed.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def _load_whisper(size, device=None, dtype=None):
+    import whisper
+    model = whisper.load_model(size, device=device)
+    if dtype:  # fast CPU modes, see fastmode.py
+        from fastmode import optimize
+        model = optimize(model, dtype)
+    return model
+
+
+def _load_mlx(repo, device=None, dtype=None):
+    import mlx.core as mx
+    from mlx_whisper.load_models import load_model
+    return load_model(repo, dtype=getattr(mx, dtype or "float16"))
+
+
+def _nbytes(model):
+    """Estimated memory held by a model's weights"""
+    if hasattr(model, "buffers"):  # torch
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    from mlx.utils import tree_flatten
+    return sum(v.nbytes for _, v in tree_flatten(model.parameters()))
+
+
+LOADERS = {"whisper": _load_whisper, "mlx": _load_mlx}
+
+
+class ModelRegistry:
+    def __init__(self, budget_mb=None):
+        """
+        Args:
+            budget_mb: Memory budget for loaded models in MB, None for no limit.
+                       A single model larger than the budget is still loaded, alone.
+        """
+        self.budget = None if budget_mb is None else budget_mb * 2**20
+        self.models = OrderedDict()  # key -> (model, nbytes), least recently used first
+        self.lock = threading.RLock()
+        self.hits = self.misses = self.evictions = 0
+        self.load_seconds = {}
+
+    def get(self, backend, size, device=None, dtype=None):
+        """
+        Returns a loaded model, loading it on first use
+
+        Args:
+            backend: 'whisper' (openai-whisper) or 'mlx' (mlx-whisper)
+            size: Model size (tiny, base, ...) or, for mlx, the Hugging Face repo
+            device: Torch device, None for the backend default
+            dtype: Weight dtype, None for the backend default. For whisper, a fast mode such as 'int8'
+        """
+        key = (backend, size, device, dtype)
+        with self.lock:
+            if key in self.models:
+                self.hits += 1
+                self.models.move_to_end(key)
+                return self.models[key][0]
+            self.misses += 1
+            start = time.perf_counter()
+            model = LOADERS[backend](size, device, dtype)
+            self.load_seconds[key] = time.perf_counter() - start
+            nbytes = _nbytes(model)
+            while self.models and self.budget is not None and self.used() + nbytes > self.budget:
+                self.models.popitem(last=False)
+                self.evictions += 1
+            self.models[key] = (model, nbytes)
+            return model
+
+    def used(self):
+        return sum(nbytes for _, nbytes in self.models.values())
+
+    def clear(self):
+        with self.lock:
+            self.models.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "loaded": ["/".join(str(k) for k in key if k) for key in self.models],
+                "used_mb": round(self.used() / 2**20, 1),
+                "load_seconds": {"/".join(str(k) for k in key if k): round(s, 3) for key, s in self.load_seconds.items()}}
+
+
+_budget = os.environ.get("WHISPER_MODEL_BUDGET_MB")
+registry = ModelRegistry(int(_budget) if _budget else None)
+get_model = registry.get
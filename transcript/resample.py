@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+from math import gcd
+import numpy as np
+from scipy.signal import firwin
+
+# Streaming polyphase resampler, so captured audio can go to Whisper (16 kHz float32) straight
+# from memory instead of being written to a wav and decoded again by ffmpeg.
+# Blocks can be any length, filter state is carried between calls.
+
+WhisperRate = 16000  # whisper.audio.SAMPLE_RATE
+
+class StreamResampler:
+    def __init__(self, rate_in: int, rate_out: int = WhisperRate):
+        g = gcd(rate_in, rate_out)
+        self.up, self.down = rate_out // g, rate_in // g
+        # same filter length/cutoff rule as scipy.signal.resample_poly, split into `up` phases
+        self.taps = int(np.ceil(20 * max(self.up, self.down) / self.up))
+        h = firwin(self.up * self.taps, 1 / max(self.up, self.down), window=('kaiser', 5.0)) * self.up
+        self.phases = np.ascontiguousarray(h.reshape(self.taps, self.up).T[:, ::-1], dtype=np.float32)
+        self.history = np.zeros(self.taps - 1, dtype=np.float32)
+        self.consumed = 0  # input samples seen so far
+        self.produced = 0  # output samples emitted so far
+
+    def __call__(self, block: np.ndarray) -> np.ndarray:
+        """Resamples one mono block, returns however many output samples it completes."""
+        buf = np.concatenate((self.history, np.asarray(block, dtype=np.float32).reshape(-1)))
+        end = -(-(self.consumed + buf.shape[0] - self.history.shape[0]) * self.up // self.down)  # ceil
+        m = np.arange(self.produced, end)
+        first = m * self.down // self.up - self.consumed  # oldest sample each output needs, offset into buf
+        windows = np.lib.stride_tricks.sliding_window_view(buf, self.taps)
+        out = np.einsum('ij,ij->i', self.phases[m * self.down % self.up], windows[first])
+        self.consumed += buf.shape[0] - self.history.shape[0]
+        self.produced = end
+        self.history = buf[buf.shape[0] - self.taps + 1:]
+        return out
+
+    def reset(self):
+        self.history[:] = 0
+        self.consumed = self.produced = 0
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import time
+import numpy as np
+
+# Fixed-capacity audio ring buffer used by livewhisper's StreamHandler.
+# Every sample is written twice (at i and i+capacity), so any window of up to `capacity`
+# samples is one contiguous slice and can be handed out as a zero-copy view.
+# Run this file directly for a micro-benchmark against the old np.concatenate approach.
+
+class RingBuffer:
+    def __init__(self, capacity: int, channels: int = 1):
+        self.capacity = capacity
+        self.data = np.zeros((2 * capacity, channels), dtype=np.float32)
+        self.written = 0  # total samples ever written, never wraps
+        self.start = None # absolute index where the current utterance begins, None when idle
+
+    def __len__(self) -> int:
+        """Number of samples in the current utterance (0 when idle)."""
+        return 0 if self.start is None else min(self.written - self.start, self.capacity)
+
+    @property
+    def recording(self) -> bool:
+        return self.start is not None
+
+    @property
+    def full(self) -> bool:
+        return len(self) >= self.capacity
+
+    def append(self, block: np.ndarray):
+        """Copies one block in. Blocks longer than capacity keep only their tail."""
+        block = block[-self.capacity:]
+        n, pos = block.shape[0], self.written % self.capacity
+        first = min(n, self.capacity - pos)
+        for off in (0, self.capacity):  # mirror write, at most two slices per copy
+            self.data[off+pos:off+pos+first] = block[:first]
+            self.data[off:off+n-first] = block[first:]
+        self.written += n
+
+    def begin(self, preroll: int = 0):
+        """Marks the start of an utterance, keeping up to `preroll` already-written samples."""
+        self.start = self.written - min(preroll, self.written, self.capacity)
+
+    def view(self, last: int = None) -> np.ndarray:
+        """Zero-copy view of the current utterance (or of the last `last` samples written).
+        Only valid until `capacity` more samples are appended, copy it if it needs to live longer."""
+        n = len(self) if last is None else min(last, self.written)
+        end = self.written % self.capacity + self.capacity  # both halves hold the same samples
+        return self.data[end - min(n, self.capacity):end]
+
+    def reset(self):
+        self.start = None
+
+def _bench(samplerate=44100, blocksize=30, seconds=(1, 5, 15, 30, 60)):
+    frames = int(samplerate * blocksize / 1000)
+    block = np.random.default_rng(0).uniform(-1, 1, (frames, 1)).astype(np.float32)
+    print(f"{'utterance':>10} {'concatenate':>14} {'ring buffer':>14}   (mean us per {blocksize} ms block)")
+    for secs in seconds:
+        nblocks = int(secs * 1000 / blocksize)
+        buffer = np.zeros((0, 1))
+        start = time.perf_counter()
+        for _ in range(nblocks): buffer = np.concatenate((buffer, block))
+        concat = (time.perf_counter() - start) / nblocks
+        ring = RingBuffer(int(samplerate * max(seconds)) + frames)
+        ring.begin()
+        start = time.perf_counter()
+        for _ in range(nblocks): ring.append(block)
+        ringtime = (time.perf_counter() - start) / nblocks
+        print(f"{secs:>9}s {concat*1e6:>14.1f} {ringtime*1e6:>14.1f}")
+
+if __name__ == '__main__':
+    _bench()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Non-speech skipping pre-pass for offline transcription
+
+Recorded calls are often a third hold music, ringing and silence, and Whisper spends full decode
+time on all of it. This pass runs the livewhisper speech heuristics (vad.py) over the whole file,
+keeps only the speech spans (padded, with short pauses bridged), and packs them together with a
+short gap between spans so Whisper still hears a pause. Timestamps in the result are mapped back
+to the original recording.
+"""
+
+import time
+
+import numpy as np
+
+from vad import make_vad, frame
+
+SAMPLE_RATE = 16000
+
+
+def find_speech(audio, engine="dominant", threshold=0.01, vocals=(50, 1000), frame_ms=30,
+                min_silence=0.6, min_speech=0.25, pad=0.2):
+    """
+    Finds the speech in a recording
+
+    Args:
+        audio: 16 kHz mono float32 audio
+        engine: VAD engine from vad.py, 'dominant' is livewhisper's original RMS + dominant frequency check
+        threshold: Minimum RMS volume
+        vocals: Frequency range that could be speech
+        frame_ms: Frame length for the VAD
+        min_silence: Pauses shorter than this (seconds) are kept as part of the speech
+        min_speech: Speech runs shorter than this (seconds) are dropped as clicks
+        pad: Seconds kept on both sides of every span
+
+    Returns:
+        List of (start, end) spans in samples
+    """
+    framelen = SAMPLE_RATE * frame_ms // 1000
+    frames = frame(audio, framelen)
+    if not len(frames):
+        return []
+    vad = make_vad(engine, SAMPLE_RATE, threshold=threshold, vocals=vocals)
+    speech = np.concatenate([vad(frames[i:i + 256]) for i in range(0, len(frames), 256)])
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    spans = []
+    for start, end in zip(edges[::2] * framelen, edges[1::2] * framelen):
+        if spans and start - spans[-1][1] < min_silence * SAMPLE_RATE:
+            spans[-1][1] = end
+        else:
+            spans.append([start, end])
+    padding = int(pad * SAMPLE_RATE)
+    spans = [(max(0, s - padding), min(audio.shape[0], e + padding)) for s, e in spans if e - s >= min_speech * SAMPLE_RATE]
+    merged = []
+    for start, end in spans:  # padding can make neighbours overlap
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def compact(audio, spans, gap=0.3):
+    """
+    Packs the speech spans into one array
+
+    Returns:
+        (audio, mapping), mapping holds (packed_start, original_start, length) per span in seconds
+    """
+    silence = np.zeros(int(gap * SAMPLE_RATE), np.float32)
+    parts, mapping, pos = [], [], 0
+    for start, end in spans:
+        parts += [audio[start:end], silence]
+        mapping.append((pos / SAMPLE_RATE, start / SAMPLE_RATE, (end - start) / SAMPLE_RATE))
+        pos += end - start + silence.shape[0]
+    return (np.concatenate(parts) if parts else np.zeros(0, np.float32)), mapping
+
+
+def to_original(t, mapping):
+    """Maps a time in the packed audio back to the original recording"""
+    if not mapping:
+        return t
+    starts = [m[0] for m in mapping]
+    packed, original, length = mapping[max(0, np.searchsorted(starts, t, side="right") - 1)]
+    return float(original + min(max(t - packed, 0.0), length))  # times inside a gap stick to the span's end
+
+
+def remap(result, mapping):
+    """Returns a copy of a Whisper result with segment and word times on the original timeline"""
+    segments = []
+    for segment in result.get("segments", []):
+        segment = dict(segment, start=to_original(segment["start"], mapping), end=to_original(segment["end"], mapping))
+        if "words" in segment:
+            segment["words"] = [dict(w, start=to_original(w["start"], mapping), end=to_original(w["end"], mapping))
+                                for w in segment["words"]]
+        segments.append(segment)
+    return dict(result, segments=segments)
+
+
+def transcribe_speech_only(transcribe, audio, engine="dominant", load=None, **options):
+    """
+    Transcribes only the speech in a recording
+
+    Args:
+        transcribe: callable(audio) returning a Whisper result dict
+        audio: 16 kHz mono float32 audio
+        engine: VAD engine used to find speech
+        load: Optional callable that loads the model, run before the decode is timed so the load
+              isn't counted as compute
+        options: Passed on to find_speech()
+
+    Returns:
+        Whisper result on the original timeline, with a 'skipped' report
+    """
+    spans = find_speech(audio, engine, **options)
+    packed, mapping = compact(audio, spans)
+    total, kept = audio.shape[0] / SAMPLE_RATE, packed.shape[0] / SAMPLE_RATE
+    if load is not None and spans:
+        load()
+    start = time.perf_counter()
+    result = remap(transcribe(packed), mapping) if spans else {"text": "", "segments": [], "language": None}
+    elapsed = time.perf_counter() - start
+    result["skipped"] = {"audio_s": round(total, 2), "transcribed_s": round(kept, 2), "skipped_s": round(total - kept, 2),
+                         "skipped_ratio": round(1 - kept / total, 3) if total else 0.0, "spans": len(spans),
+                         # decode cost scales with audio length, so this is what the skipped part would have cost
+                         "compute_s": round(elapsed, 2), "compute_saved_s": round(elapsed / kept * (total - kept), 2) if kept else None}
+    return result
+
+
+def transcribe_file_speech_only(transcribe, audio, engine="dominant", load=None, cache=None):
+    """
+    The CLIs' skip-silence mode: transcribe_speech_only() plus a one-line report of what was skipped
+
+    Args:
+        cache: Optional TranscriptCache that `transcribe` reads, a hit means nothing was decoded
+        The rest as for transcribe_speech_only()
+
+    Returns:
+        Whisper result on the original timeline, with a 'skipped' report
+    """
+    hits = cache.hits if cache is not None else 0
+    result = transcribe_speech_only(transcribe, audio, engine, load=load)
+    skipped = result["skipped"]
+    if cache is not None and cache.hits > hits:  # nothing was decoded, there's no compute to compare
+        skipped["compute_s"] = skipped["compute_saved_s"] = None
+        saved = "cached result, nothing decoded"
+    elif skipped["compute_saved_s"] is not None:
+        saved = f"~{skipped['compute_saved_s']:.1f}s of compute"
+    else:
+        saved = "all of compute"
+    print(f"Skipped {skipped['skipped_s']:.1f}s of {skipped['audio_s']:.1f}s audio ({skipped['skipped_ratio']:.0%}), {saved}")
+    return result
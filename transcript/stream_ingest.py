@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Streaming ingest for recordings too long to decode in one go
+
+whisper.transcribe() and mlx_whisper.transcribe() decode the whole input to one float32 array
+before doing anything, GBs of RSS for a multi-hour call. Here ffmpeg's output is read through a
+pipe in fixed-size PCM chunks, and the transcriber is fed one window at a time. Segments are
+yielded as soon as their window is decoded, and at most about one window of audio is held at once.
+"""
+
+import subprocess
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def pcm_chunks(path, seconds=5.0, rate=SAMPLE_RATE):
+    """Yields the input as mono float32 chunks of `seconds` each (the last one may be shorter)"""
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path,
+           "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(rate), "-"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    size = int(seconds * rate) * 2
+    try:
+        while data := proc.stdout.read(size):
+            yield np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        error = proc.stderr.read().decode().strip()
+        if proc.wait() not in (0, -9) and error:
+            raise RuntimeError(f"Failed to load audio: {error}")
+
+
+def transcribe_stream(transcribe, chunks, window=30.0, **options):
+    """
+    Transcribes a chunk stream window by window
+
+    Args:
+        transcribe: callable(audio, **options) returning a Whisper result dict
+        chunks: Iterable of 16 kHz mono float32 arrays, e.g. from pcm_chunks()
+        window: Seconds of audio decoded per call
+        options: Passed on to transcribe (language, ...)
+
+    Yields:
+        Segments with timestamps on the timeline of the whole input
+    """
+    buffer, offset, prompt = np.zeros(0, np.float32), 0.0, None
+    chunks = iter(chunks)
+    finished = False
+    while not finished:
+        for chunk in chunks:
+            buffer = np.concatenate((buffer, chunk))
+            if buffer.shape[0] >= window * SAMPLE_RATE:
+                break
+        else:
+            finished = True
+        if not buffer.shape[0]:
+            break
+        segments = transcribe(buffer, initial_prompt=prompt, **options)["segments"]
+        # the last segment may run into the window edge, its audio is decoded again with the next window
+        cut = int(segments[-1]["start"] * SAMPLE_RATE) if len(segments) > 1 and not finished else buffer.shape[0]
+        if cut < SAMPLE_RATE:
+            cut = buffer.shape[0]  # no progress otherwise
+        done = [s for s in segments if s["start"] * SAMPLE_RATE < cut] if cut < buffer.shape[0] else segments
+        for segment in done:
+            segment = dict(segment, start=segment["start"] + offset, end=segment["end"] + offset)
+            if "words" in segment:
+                segment["words"] = [dict(w, start=w["start"] + offset, end=w["end"] + offset) for w in segment["words"]]
+            yield segment
+        prompt = "".join(s["text"] for s in done)[-200:] or prompt
+        buffer, offset = buffer[cut:], offset + cut / SAMPLE_RATE
+
+
+def transcribe_stream_file(transcribe, path, language=None, output=None):
+    """
+    The CLIs' stream mode: bounded-memory ingest, segments are printed as soon as they are decoded
+
+    Args:
+        transcribe: callable(audio, **options) returning a Whisper result dict
+        path: Audio file, anything ffmpeg reads
+        language: Optional language code
+        output: Optional file the text is written to
+    """
+    options = {"language": language} if language else {}
+    start_time = time.time()
+    text = []
+    for segment in transcribe_stream(transcribe, pcm_chunks(path), **options):
+        print(f"[{segment['start']:8.2f} -> {segment['end']:8.2f}]{segment['text']}", flush=True)
+        text.append(segment["text"])
+    print(f"\nTranscribed in {time.time() - start_time:.2f}s")
+
+    if output:
+        with open(output, 'w') as f:
+            f.write("".join(text))
+        print(f"\nTranscription saved to: {output}")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import numpy as np
+from resample import WhisperRate
+
+# Streaming partial transcripts for livewhisper. While the caller is still talking, the audio of the
+# utterance so far is re-decoded every few hundred ms. Words are only committed once two consecutive
+# hypotheses agree on them (local agreement), so partials grow monotonically instead of flickering.
+# Once committed audio is older than the window, the window slides past it to keep each decode short.
+
+def _norm(word: str) -> str:
+    return "".join(ch for ch in word if ch not in ",.?!'\"").strip().lower()
+
+class LocalAgreement:
+    """Commits the longest common prefix of the last two hypotheses (LocalAgreement-2)."""
+    def __init__(self):
+        self.committed = []  # (word, start, end), absolute seconds from the utterance start
+        self.previous = []
+
+    @property
+    def end(self) -> float:
+        return self.committed[-1][2] if self.committed else 0.0
+
+    def update(self, words: list) -> list:
+        words = [w for w in words if w[1] >= self.end - 0.05] # drop what the window still holds but we committed
+        agree = 0
+        for new, old in zip(words, self.previous):
+            if _norm(new[0]) != _norm(old[0]): break
+            agree += 1
+        self.committed += words[:agree]
+        self.previous = words[agree:]
+        return words[:agree]
+
+    def text(self, words=None) -> str:
+        return "".join(w[0] for w in (self.committed if words is None else words)).strip()
+
+class StreamingDecoder:
+    def __init__(self, model, window=15.0, **options):
+        self.model, self.window = model, window
+        self.options = dict(options, word_timestamps=True, condition_on_previous_text=False)
+        self.reset()
+
+    def reset(self, uid=None):
+        self.uid = uid       # which utterance this state belongs to
+        self.trimmed = 0     # samples of the utterance already slid out of the window
+        self.decoded = 0     # utterance length at the last decode, to skip steps with no new audio
+        self.agreement = LocalAgreement()
+
+    def _words(self, audio: np.ndarray) -> list:
+        prompt = self.agreement.text()[-200:] or None # committed text keeps the decode consistent
+        result = self.model.transcribe(audio[self.trimmed:], initial_prompt=prompt, **self.options)
+        offset = self.trimmed / WhisperRate
+        return [(w['word'], offset + w['start'], offset + w['end']) for s in result['segments'] for w in s.get('words', [])]
+
+    def step(self, audio: np.ndarray) -> list:
+        """Decodes the utterance so far (16 kHz, from its start), returns the newly committed words."""
+        self.decoded = audio.shape[0]
+        new = self.agreement.update(self._words(audio))
+        if (audio.shape[0] - self.trimmed) / WhisperRate > self.window and self.agreement.committed:
+            self.trimmed = max(self.trimmed, int(self.agreement.end * WhisperRate))
+        return new
+
+    def finish(self, audio: np.ndarray) -> str:
+        """Final decode at the endpoint: committed words plus everything the last pass heard after them."""
+        words = [w for w in self._words(audio) if w[1] >= self.agreement.end - 0.05]
+        return self.agreement.text(self.agreement.committed + words)
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # livewhisper imports its siblings flat
+
+import livewhisper  # noqa: E402
+from resample import WhisperRate  # noqa: E402
+
+RATE = livewhisper.SampleRate
+BLOCK = RATE * livewhisper.BlockSize // 1000
+
+
+class FakeWhisper:
+    def transcribe(self, audio, **options):
+        words = [{'word': f' w{i}', 'start': i * 0.25, 'end': i * 0.25 + 0.2} for i in range(len(audio) // (WhisperRate // 4))]
+        return {'text': ''.join(w['word'] for w in words), 'segments': [{'words': words}]}
+
+
+def handler(monkeypatch):
+    monkeypatch.setattr(livewhisper, 'get_model', lambda *args, **kwargs: FakeWhisper())
+    monkeypatch.setattr(livewhisper, 'AdaptiveEnd', False)
+    monkeypatch.setattr(livewhisper, 'EndBlocks', 8)  # a 0.7 s blip plus its silence stays under Whisper's 1 s minimum
+    return livewhisper.StreamHandler(streaming=True)
+
+
+def play(handler, amplitude, seconds, partials=True):
+    t = np.arange(BLOCK) / RATE
+    for i in range(int(seconds * 1000 / livewhisper.BlockSize)):
+        block = amplitude * np.sin(2 * np.pi * 200 * t) + 0.0005 * np.sin(2 * np.pi * 3000 * t + i)
+        handler.callback(block[:, None].astype(np.float32), BLOCK, None, None)
+        if partials and i % 5 == 4: handler.partial()
+
+
+def test_partials_resume_after_a_blip_too_short_to_transcribe(monkeypatch):
+    h = handler(monkeypatch)
+    play(h, 0.1, 0.7)
+    assert h.streamer.uid == h.uttid  # the blip got partials
+    blip = h.uttid
+    play(h, 0.0, 0.5, partials=False)
+    assert len(h.queue) == 0 and not h.ring.recording  # thrown away without a final pass
+    play(h, 0.1, 2)
+    assert h.uttid > blip and h.streamer.uid == h.uttid and h.streamer.agreement.committed
+
+
+def test_partials_resume_after_their_utterance_is_dropped_from_the_queue(monkeypatch):
+    monkeypatch.setattr(livewhisper, 'QueueSize', 1)
+    h = handler(monkeypatch)
+    play(h, 0.1, 1.5)
+    first = h.uttid
+    play(h, 0.0, 0.5, partials=False)
+    play(h, 0.1, 1.5, partials=False)
+    play(h, 0.0, 0.5, partials=False)  # evicts the first utterance, nobody took it off the queue
+    assert h.queue.dropped == 1 and h.streamer.uid != first
+    play(h, 0.1, 1.5)
+    assert h.streamer.uid == h.uttid and h.streamer.agreement.committed
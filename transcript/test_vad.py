@@ -0,0 +1,33 @@
+import numpy as np
+
+from transcript.vad import EnergyVAD
+
+RATE = 16000
+BLOCK = RATE * 30 // 1000  # livewhisper's 30 ms blocks
+
+
+def blocks(amplitude, seconds, noise=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(BLOCK) / RATE
+    for _ in range(int(seconds * 1000 / 30)):
+        yield amplitude * np.sin(2 * np.pi * 200 * t) + noise * rng.standard_normal(BLOCK)
+
+
+def test_sustained_speech_fed_block_by_block_stays_speech():
+    vad = EnergyVAD(RATE)
+    assert all(vad(block)[0] for block in blocks(0.1, 5))
+
+
+def test_floor_drops_after_speech_and_speech_is_detected_again():
+    vad = EnergyVAD(RATE)
+    for block in blocks(0.0, 2, noise=0.001):
+        vad(block)
+    assert all(vad(block)[0] for block in blocks(0.1, 2))
+    assert not any(vad(block)[0] for block in blocks(0.0, 1, noise=0.001))
+    assert all(vad(block)[0] for block in blocks(0.1, 1))
+
+
+def test_steady_line_noise_is_learned_as_floor():
+    vad = EnergyVAD(RATE)
+    detected = [vad(block)[0] for block in blocks(0.0, 15, noise=0.05)]
+    assert not any(detected[-50:])
@@ -4,46 +4,141 @@ Audio transcription script using OpenAI Whisper
 """
 
 import whisper
+import os
 import sys
 import argparse
 import time
 
+from registry import get_model, registry
+from fastmode import mode as fast_mode, parse as parse_fast, ENV as FAST_ENV
+from cache import TranscriptCache, DEFAULT_DIR
+from batch import is_batch, collect, run_batch, MAX_DEFAULT_JOBS
+from stream_ingest import transcribe_stream_file
+from chunking import transcribe_long
+from speech_only import transcribe_file_speech_only
+from vad import Engines
 
-def transcribe_audio(audio_file, model_size="base", language=None):
+
+def load_model(model_size="base"):
+    """Returns the shared Whisper model of this size, loading it on first use (in the WHISPER_FAST mode, if set)"""
+    return get_model("whisper", model_size, dtype=fast_mode())
+
+
+def load_audio(audio_file):
+    """Decodes an audio file to a 16 kHz mono float32 array"""
+    return whisper.load_audio(audio_file)
+
+
+def transcribe_audio(audio_file, model_size="base", language=None, cache=None):
     """
     Transcribe an audio file using Whisper
 
     Args:
-        audio_file: Path to the audio file
+        audio_file: Path to the audio file, or audio already decoded by load_audio()
         model_size: Whisper model size (tiny, base, small, medium, large)
         language: Optional language code (e.g., 'en', 'es', 'fr')
+        cache: Optional TranscriptCache, results are looked up by the decoded audio
 
     Returns:
         Transcription result
     """
+    if cache is not None:
+        if isinstance(audio_file, str):
+            audio_file = load_audio(audio_file)
+        key = cache.key(audio_file, "/".join(filter(None, ("whisper", model_size, fast_mode()))), language)
+        if (result := cache.get(key)) is not None:
+            print("Using cached transcription")
+            return result
+
     print(f"Loading Whisper model: {model_size}")
-    model = whisper.load_model(model_size)
+    model = load_model(model_size)
 
-    print(f"Transcribing: {audio_file}")
+    if isinstance(audio_file, str):
+        print(f"Transcribing: {audio_file}")
     result = model.transcribe(audio_file, language=language)
 
+    if cache is not None:
+        cache.put(key, result)
     return result
 
 
+def transcribe_long_file(args, cache_dir=None):
+    """Long mode: chunked parallel transcription, optionally timed against the single-pass path"""
+    audio = load_audio(args.audio_file[0])
+    start_time = time.time()
+    result = transcribe_long("transcribe_audio", audio, args.model, args.language, args.jobs, args.chunk_seconds, cache_dir=cache_dir)
+    parallel = time.time() - start_time
+
+    print("\n" + "="*50)
+    print(f"TRANSCRIPTION ({parallel:.2f}s, {len(result['chunks'])} chunks, {audio.shape[0] / 16000:.0f}s of audio):")
+    print("="*50)
+    print(result["text"])
+
+    if args.compare:
+        start_time = time.time()
+        transcribe_audio(audio, args.model, args.language)
+        single = time.time() - start_time
+        print(f"\nSingle pass: {single:.2f}s, chunked: {parallel:.2f}s, speedup: {single / parallel:.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(result["text"])
+        print(f"\nTranscription saved to: {args.output}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Transcribe audio files using OpenAI Whisper")
-    parser.add_argument("audio_file", help="Path to the audio file")
+    parser.add_argument("audio_file", nargs="+", help="Path to the audio file (several files, directories or globs for batch mode)")
     parser.add_argument("-m", "--model", default="base",
                         choices=["tiny", "base", "small", "medium", "large"],
                         help="Whisper model size (default: base)")
     parser.add_argument("-l", "--language", help="Language code (e.g., en, es, fr)")
-    parser.add_argument("-o", "--output", help="Output file for transcription (optional)")
+    parser.add_argument("-o", "--output", help="Output file for transcription (optional, JSONL in batch mode)")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the transcription cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_DIR, help=f"Transcription cache directory (default: {DEFAULT_DIR})")
+    parser.add_argument("--stream", action="store_true",
+                        help="Decode and transcribe window by window with bounded memory, printing segments as they finish")
+    parser.add_argument("--fast", metavar="MODE", type=parse_fast,
+                        help="Faster CPU inference: int8, compile or int8+compile (see fastmode.py)")
+    parser.add_argument("--skip-silence", action="store_true",
+                        help="Only send detected speech to the model, skipping silence, ringing and hold music")
+    parser.add_argument("--vad", default="dominant", choices=sorted(Engines),
+                        help="Skip-silence mode: speech detector (default: dominant)")
+    parser.add_argument("--manifest", help="Batch mode: file listing audio paths, one per line or JSONL with a 'path' field")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Batch/long mode: number of worker processes, each holds its own copy of the model in memory "
+                             f"(~1.5 GB for medium, ~3 GB for large; default: CPU count, at most {MAX_DEFAULT_JOBS})")
+    parser.add_argument("--long", action="store_true", help="Split a long recording at silences and transcribe the chunks in parallel")
+    parser.add_argument("--chunk-seconds", type=float, default=120, help="Long mode: longest chunk in seconds (default: 120)")
+    parser.add_argument("--compare", action="store_true", help="Long mode: also run the single-pass path and report the speedup")
 
     args = parser.parse_args()
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.fast:
+        os.environ[FAST_ENV] = args.fast  # inherited by batch and long mode workers
 
     try:
+        if is_batch(args.audio_file, args.manifest):
+            paths = collect(args.audio_file, args.manifest)
+            summary = run_batch("transcribe_audio", paths, args.model, args.language, args.jobs, args.output, cache_dir)
+            print(f"\nBatch done: {summary}", file=sys.stderr)
+            return
+
+        if args.long:
+            transcribe_long_file(args, cache_dir)
+            return
+
+        if args.stream:
+            transcribe_stream_file(load_model(args.model).transcribe, args.audio_file[0], args.language, args.output)
+            return
+
         start_time = time.time()
-        result = transcribe_audio(args.audio_file, args.model, args.language)
+        cache = TranscriptCache(cache_dir) if cache_dir else None
+        if args.skip_silence:
+            result = transcribe_file_speech_only(lambda audio: transcribe_audio(audio, args.model, args.language, cache),
+                                                 load_audio(args.audio_file[0]), args.vad, load=lambda: load_model(args.model), cache=cache)
+        else:
+            result = transcribe_audio(args.audio_file[0], args.model, args.language, cache)
 
         print("\n" + "="*50)
         print(f"TRANSCRIPTION ({time.time() - start_time}):")
@@ -54,6 +149,7 @@ def main():
             with open(args.output, 'w') as f:
                 f.write(result["text"])
             print(f"\nTranscription saved to: {args.output}")
+        print(f"Models: {registry.stats()}")
 
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
@@ -4,53 +4,119 @@ Audio transcription script using OpenAI Whisper with MLX framework
 """
 
 import mlx_whisper
+from mlx_whisper.audio import load_audio
+from mlx_whisper.transcribe import ModelHolder
 import sys
 import argparse
 import time
+from functools import partial
 
+from registry import get_model, registry
+from cache import TranscriptCache, DEFAULT_DIR
+from batch import is_batch, collect, run_batch, MAX_DEFAULT_JOBS
+from stream_ingest import transcribe_stream_file
+from speech_only import transcribe_file_speech_only
+from vad import Engines
 
-def transcribe_audio(audio_file, model_size="base", language=None):
+MLX_REPO = "mlx-community/whisper-turbo"
+
+
+def load_model(model_size="base"):
+    """
+    Loads the MLX Whisper model through the shared registry
+
+    mlx_whisper keeps one model in ModelHolder and reloads whenever the path differs,
+    so the registry's copy is handed to it and it's never loaded twice
+    """
+    ModelHolder.model = get_model("mlx", MLX_REPO)
+    ModelHolder.model_path = MLX_REPO
+    return ModelHolder.model
+
+
+def transcribe_audio(audio_file, model_size="base", language=None, cache=None):
     """
     Transcribe an audio file using Whisper with MLX
 
     Args:
-        audio_file: Path to the audio file
+        audio_file: Path to the audio file, or audio already decoded by load_audio()
         model_size: Whisper model size (tiny, base, small, medium, large)
         language: Optional language code (e.g., 'en', 'es', 'fr')
+        cache: Optional TranscriptCache, results are looked up by the decoded audio
 
     Returns:
         Transcription result
     """
+    if cache is not None:
+        if isinstance(audio_file, str):
+            audio_file = load_audio(audio_file)
+        key = cache.key(audio_file, f"mlx/{MLX_REPO}", language)
+        if (result := cache.get(key)) is not None:
+            print("Using cached transcription")
+            return result
+
     print(f"Transcribing with MLX Whisper model: {model_size}")
 
     # MLX Whisper uses transcribe directly with model parameter
     options = {
-        "path_or_hf_repo": f"mlx-community/whisper-turbo",
+        "path_or_hf_repo": MLX_REPO,
         "verbose": False
     }
+    load_model(model_size)
 
     if language:
         options["language"] = language
 
     result = mlx_whisper.transcribe(audio_file, **options)
 
+    if cache is not None:
+        cache.put(key, result)
     return result
 
 
 def main():
     parser = argparse.ArgumentParser(description="Transcribe audio files using OpenAI Whisper with MLX")
-    parser.add_argument("audio_file", help="Path to the audio file")
+    parser.add_argument("audio_file", nargs="+", help="Path to the audio file (several files, directories or globs for batch mode)")
     parser.add_argument("-m", "--model", default="base",
                         choices=["tiny", "base", "small", "medium", "large","turbo"],
                         help="Whisper model size (default: base)")
     parser.add_argument("-l", "--language", help="Language code (e.g., en, es, fr)")
-    parser.add_argument("-o", "--output", help="Output file for transcription (optional)")
+    parser.add_argument("-o", "--output", help="Output file for transcription (optional, JSONL in batch mode)")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the transcription cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_DIR, help=f"Transcription cache directory (default: {DEFAULT_DIR})")
+    parser.add_argument("--stream", action="store_true",
+                        help="Decode and transcribe window by window with bounded memory, printing segments as they finish")
+    parser.add_argument("--skip-silence", action="store_true",
+                        help="Only send detected speech to the model, skipping silence, ringing and hold music")
+    parser.add_argument("--vad", default="dominant", choices=sorted(Engines),
+                        help="Skip-silence mode: speech detector (default: dominant)")
+    parser.add_argument("--manifest", help="Batch mode: file listing audio paths, one per line or JSONL with a 'path' field")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Batch mode: number of worker processes, each holds its own copy of the model in memory "
+                             f"(~1.6 GB for turbo; default: CPU count, at most {MAX_DEFAULT_JOBS})")
 
     args = parser.parse_args()
+    cache_dir = None if args.no_cache else args.cache_dir
 
     try:
+        if is_batch(args.audio_file, args.manifest):
+            paths = collect(args.audio_file, args.manifest)
+            summary = run_batch("transcribe_audio_mlx", paths, args.model, args.language, args.jobs, args.output, cache_dir)
+            print(f"\nBatch done: {summary}", file=sys.stderr)
+            return
+
+        if args.stream:
+            load_model(args.model)
+            transcribe = partial(mlx_whisper.transcribe, path_or_hf_repo=MLX_REPO, verbose=False)
+            transcribe_stream_file(transcribe, args.audio_file[0], args.language, args.output)
+            return
+
         start_time = time.time()
-        result = transcribe_audio(args.audio_file, args.model, args.language)
+        cache = TranscriptCache(cache_dir) if cache_dir else None
+        if args.skip_silence:
+            result = transcribe_file_speech_only(lambda audio: transcribe_audio(audio, args.model, args.language, cache),
+                                                 load_audio(args.audio_file[0]), args.vad, load=lambda: load_model(args.model), cache=cache)
+        else:
+            result = transcribe_audio(args.audio_file[0], args.model, args.language, cache)
 
         print("\n" + "="*50)
         print(f"TRANSCRIPTION ({time.time() - start_time:.2f}s):")
@@ -61,6 +127,7 @@ def main():
             with open(args.output, 'w') as f:
                 f.write(result["text"])
             print(f"\nTranscription saved to: {args.output}")
+        print(f"Models: {registry.stats()}")
 
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import threading, time
+from collections import deque
+import numpy as np
+
+# Bounded hand-off queue between the audio callback (producer) and the transcription worker (consumer).
+# put() never blocks, so it's safe inside the sounddevice callback. When the queue is full the
+# backpressure policy decides what gives: 'drop_oldest' throws away the oldest waiting utterance,
+# 'merge' glues the new audio onto the newest waiting one so nothing the caller said is lost.
+# on_drop(info) is told about every utterance that won't come out of get() under its own info: evicted
+# by 'drop_oldest', or absorbed into a newer one by 'merge'. It runs on the producer's thread, so keep it short.
+
+Policies = ('drop_oldest', 'merge')
+
+class Utterance:
+    def __init__(self, audio: np.ndarray, **info):
+        self.parts = [audio]         # merged utterances are joined lazily, on the consumer side
+        self.info = info             # e.g. the endpoint delay that closed the utterance
+        self.merges = 0              # later utterances glued on by the 'merge' policy
+        self.queued = time.monotonic()
+
+    @property
+    def audio(self) -> np.ndarray:
+        if len(self.parts) > 1: self.parts = [np.concatenate(self.parts)]
+        return self.parts[0]
+
+class UtteranceQueue:
+    def __init__(self, maxsize: int = 4, policy: str = 'drop_oldest', history: int = 100, on_drop=None):
+        if policy not in Policies: raise ValueError(f"Unknown backpressure policy '{policy}', use one of {Policies}")
+        self.maxsize, self.policy, self.on_drop = maxsize, policy, on_drop
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.queued = self.dropped = self.merged = self.maxdepth = 0
+        self.waits = deque(maxlen=history)  # seconds between an utterance ending and Whisper picking it up
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def put(self, audio: np.ndarray, **info):
+        with self.cond:
+            self.queued += 1
+            if len(self.items) >= self.maxsize:
+                if self.policy == 'merge':
+                    if self.on_drop: self.on_drop(dict(self.items[-1].info))
+                    self.items[-1].parts.append(audio)
+                    self.items[-1].info.update(info)
+                    self.items[-1].merges += 1
+                    self.merged += 1
+                    return
+                dropped = self.items.popleft()
+                self.dropped += 1
+                if self.on_drop: self.on_drop(dropped.info)
+            self.items.append(Utterance(audio, **info))
+            self.maxdepth = max(self.maxdepth, len(self.items))
+            self.cond.notify()
+
+    def get(self, timeout: float = None) -> Utterance | None:
+        """Blocks until an utterance is ready, returns None on timeout or once closed and drained."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items or self.closed, timeout) or not self.items: return None
+            item = self.items.popleft()
+        self.waits.append(time.monotonic() - item.queued)
+        return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self) -> dict:
+        waits = list(self.waits)
+        return {'depth': len(self.items), 'max_depth': self.maxdepth, 'queued': self.queued,
+                'dropped': self.dropped, 'merged': self.merged,
+                'wait_mean': float(np.mean(waits)) if waits else 0.0, 'wait_max': max(waits, default=0.0)}
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+import inspect
+from collections import deque
+
+import numpy as np
+
+# Voice activity detection engines for livewhisper. Every engine takes a batch of equal length
+# frames, shape (n, framelen), and returns one bool per frame, so offline tools can push whole
+# files through in large batches while the live callback passes a single block.
+# Pick one by name with make_vad(), see vad_bench.py for an offline comparison on WAV files.
+
+class VAD:
+    name = None
+
+    def __init__(self, samplerate: int, threshold: float = 0.01):
+        self.samplerate = samplerate
+        self.threshold = threshold  # minimum RMS volume, shared by all engines
+
+    def __call__(self, frames: np.ndarray) -> np.ndarray:
+        frames = np.asarray(frames, dtype=np.float32)
+        return self.detect(frames[None, :] if frames.ndim == 1 else frames)
+
+    def detect(self, frames: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def rms(self, frames: np.ndarray) -> np.ndarray:
+        return np.sqrt(np.einsum('ij,ij->i', frames, frames) / frames.shape[1])
+
+class DominantFreqVAD(VAD):
+    """The original livewhisper check: loud enough, and the strongest FFT bin lies in the vocal range."""
+    name = 'dominant'
+
+    def __init__(self, samplerate, threshold=0.01, vocals=(50, 1000)):
+        super().__init__(samplerate, threshold)
+        self.vocals = vocals
+
+    def detect(self, frames):
+        freq = np.argmax(np.abs(np.fft.rfft(frames, axis=1)), axis=1) * self.samplerate / frames.shape[1]
+        return (self.rms(frames) > self.threshold) & (self.vocals[0] <= freq) & (freq <= self.vocals[1])
+
+class EnergyVAD(VAD):
+    """RMS energy against an adaptive noise floor, so a hissy phone line doesn't count as speech.
+    The floor is a low percentile of the RMS of the last `window` frames, kept across calls so the
+    live callback's one block per call sees the same floor as a whole file. The history starts
+    filled with the initial floor, so it only rises once nearly the whole window was loud (~8 s of
+    30 ms blocks), and sustained speech isn't mistaken for noise."""
+    name = 'energy'
+
+    def __init__(self, samplerate, threshold=0.01, margin=2.0, window=300, quantile=10):
+        super().__init__(samplerate, threshold)
+        self.margin = margin          # speech must be this many times louder than the noise floor
+        self.quantile = quantile      # percentile of the recent frames taken as the floor
+        self.floor = threshold / margin
+        self.levels = deque([self.floor] * window, maxlen=window)  # RMS of the most recent frames
+
+    def detect(self, frames):
+        rms = self.rms(frames)
+        speech = rms > max(self.threshold, self.floor * self.margin)
+        self.levels.extend(rms.tolist())
+        self.floor = float(np.percentile(self.levels, self.quantile))
+        return speech
+
+class BandRatioVAD(VAD):
+    """Share of frame energy inside the vocal band. Only the band's DFT bins are computed (one matmul
+    against a cached cos/sin basis) instead of a full FFT, total energy comes from Parseval."""
+    name = 'band'
+
+    def __init__(self, samplerate, threshold=0.01, vocals=(50, 1000), ratio=0.5):
+        super().__init__(samplerate, threshold)
+        self.vocals, self.ratio = vocals, ratio
+        self.basis = self.window = None
+
+    def _basis(self, framelen: int):
+        if self.basis is None or self.basis.shape[0] != framelen:
+            bins = np.arange(1, framelen // 2)
+            bins = bins[(bins * self.samplerate / framelen >= self.vocals[0]) & (bins * self.samplerate / framelen <= self.vocals[1])]
+            self.window = np.hanning(framelen).astype(np.float32)
+            phase = 2 * np.pi * np.outer(np.arange(framelen), bins) / framelen
+            self.basis = (self.window[:, None] * np.hstack((np.cos(phase), np.sin(phase)))).astype(np.float32)
+        return self.basis
+
+    def detect(self, frames):
+        band = 2 * np.sum((frames @ self._basis(frames.shape[1])) ** 2, axis=1)
+        windowed = frames * self.window
+        total = frames.shape[1] * np.einsum('ij,ij->i', windowed, windowed) + 1e-12
+        return (self.rms(frames) > self.threshold) & (band / total > self.ratio)
+
+class ZeroCrossingVAD(VAD):
+    """Zero-crossing rate: voiced speech crosses far less often than hiss and line noise."""
+    name = 'zcr'
+
+    def __init__(self, samplerate, threshold=0.01, crossings=(50, 4000)):
+        super().__init__(samplerate, threshold)
+        self.crossings = crossings  # allowed zero crossings per second
+
+    def detect(self, frames):
+        signs = np.signbit(frames)
+        rate = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) * self.samplerate / frames.shape[1]
+        return (self.rms(frames) > self.threshold) & (self.crossings[0] <= rate) & (rate <= self.crossings[1])
+
+Engines = {engine.name: engine for engine in (DominantFreqVAD, EnergyVAD, BandRatioVAD, ZeroCrossingVAD)}
+
+def make_vad(name: str, samplerate: int, **options) -> VAD:
+    """Builds an engine by name, options the engine doesn't take (e.g. vocals for 'energy') are ignored."""
+    if name not in Engines: raise ValueError(f"Unknown VAD engine '{name}', use one of {list(Engines)}")
+    accepted = inspect.signature(Engines[name]).parameters
+    return Engines[name](samplerate, **{k: v for k, v in options.items() if k in accepted})
+
+def frame(audio: np.ndarray, framelen: int) -> np.ndarray:
+    """Splits mono audio into a (n, framelen) view, dropping the incomplete tail."""
+    n = audio.shape[0] // framelen
+    return audio[:n * framelen].reshape(n, framelen)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Offline harness for the VAD engines in vad.py
+
+Replays WAV files frame by frame through every engine and reports the CPU cost per frame and,
+when reference labels are available, frame-level detection accuracy. Labels are read from an
+Audacity label track next to the WAV (same name, .txt), one "start<TAB>end[<TAB>label]" span of
+speech in seconds per line. --synthetic generates a labelled test file instead.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from scipy.io.wavfile import read
+
+from vad import Engines, make_vad, frame
+
+
+def load_wav(path):
+    """Reads a WAV as mono float32 in [-1, 1]"""
+    rate, audio = read(path)
+    if np.issubdtype(audio.dtype, np.integer):
+        audio = audio / float(np.iinfo(audio.dtype).max)
+    audio = np.asarray(audio, dtype=np.float32)
+    return rate, audio.mean(axis=1) if audio.ndim > 1 else audio
+
+
+def load_labels(path):
+    """Reads an Audacity label track into a list of (start, end) speech spans in seconds"""
+    spans = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 2:
+                spans.append((float(fields[0]), float(fields[1])))
+    return spans
+
+
+def synthetic(seconds=30, rate=16000, noise=0.02, seed=0):
+    """
+    Builds a phone-line-like test signal: bursts of harmonic, syllable-modulated 'speech'
+    over band-limited hiss and a 50 Hz hum, plus the matching label spans
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    audio = noise * rng.standard_normal(t.shape[0]) + 0.005 * np.sin(2 * np.pi * 50 * t)
+    spans, pos = [], rng.uniform(0.5, 2)
+    while pos < seconds - 1:
+        length = rng.uniform(0.5, 3)
+        sel = (t >= pos) & (t < min(pos + length, seconds))
+        f0 = rng.uniform(90, 250)
+        voice = sum(np.sin(2 * np.pi * f0 * h * t[sel]) / h for h in range(1, 8))
+        voice *= 0.1 * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * (t[sel] - pos)))  # ~4 syllables per second
+        audio[sel] += voice
+        spans.append((pos, min(pos + length, seconds)))
+        pos += length + rng.uniform(0.3, 2.5)
+    return rate, audio.astype(np.float32), spans
+
+
+def truth(spans, nframes, framelen, rate):
+    centres = (np.arange(nframes) + 0.5) * framelen / rate
+    labels = np.zeros(nframes, dtype=bool)
+    for start, end in spans:
+        labels |= (centres >= start) & (centres < end)
+    return labels
+
+
+def run(name, rate, audio, labels, frame_ms, batch, options):
+    framelen = int(rate * frame_ms / 1000)
+    frames = frame(audio, framelen)
+    vad = make_vad(name, rate, **options)
+    start = time.process_time()
+    decisions = np.concatenate([vad(frames[i:i + batch]) for i in range(0, len(frames), batch)])
+    cpu = time.process_time() - start
+    report = {"engine": name, "frames": len(frames), "us_per_frame": 1e6 * cpu / max(len(frames), 1),
+              "speech_ratio": float(decisions.mean()) if len(frames) else 0.0}
+    if labels is not None:
+        ref = truth(labels, len(frames), framelen, rate)
+        tp, fp, fn = np.sum(decisions & ref), np.sum(decisions & ~ref), np.sum(~decisions & ref)
+        report.update(accuracy=float(np.mean(decisions == ref)),
+                      precision=float(tp / max(tp + fp, 1)), recall=float(tp / max(tp + fn, 1)))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VAD engines on WAV files")
+    parser.add_argument("wav_files", nargs="*", help="WAV files to replay")
+    parser.add_argument("-e", "--engines", nargs="+", default=list(Engines), choices=list(Engines),
+                        help="Engines to run (default: all)")
+    parser.add_argument("--frame-ms", type=int, default=30, help="Frame length in milliseconds (default: 30)")
+    parser.add_argument("--batch", type=int, default=64, help="Frames per detect call (default: 64)")
+    parser.add_argument("--threshold", type=float, default=0.01, help="Minimum RMS volume (default: 0.01)")
+    parser.add_argument("--synthetic", type=float, metavar="SECONDS",
+                        help="Also run on a generated, labelled phone-line signal of this length")
+    parser.add_argument("--json", action="store_true", help="Print one JSON record per run instead of a table")
+
+    args = parser.parse_args()
+    if not args.wav_files and not args.synthetic:
+        parser.error("give WAV files and/or --synthetic SECONDS")
+
+    inputs = []
+    if args.synthetic:
+        inputs.append(("<synthetic>",) + synthetic(args.synthetic))
+    for path in args.wav_files:
+        labels = os.path.splitext(path)[0] + ".txt"
+        inputs.append((path,) + load_wav(path) + (load_labels(labels) if os.path.exists(labels) else None,))
+
+    if not args.json:
+        print(f"{'input':<24} {'engine':<9} {'us/frame':>9} {'speech':>7} {'acc':>6} {'prec':>6} {'recall':>6}")
+    for path, rate, audio, labels in inputs:
+        for name in args.engines:
+            report = run(name, rate, audio, labels, args.frame_ms, args.batch, {"threshold": args.threshold})
+            report["input"] = path
+            if args.json:
+                print(json.dumps(report))
+                continue
+            scores = "".join(f" {report[k]:>6.3f}" if k in report else f" {'-':>6}" for k in ("accuracy", "precision", "recall"))
+            print(f"{os.path.basename(path)[-24:]:<24} {name:<9} {report['us_per_frame']:>9.1f} {report['speech_ratio']:>7.2f}{scores}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())